@@ -0,0 +1,143 @@
+"""Broadlink IR frame codec.
+
+A Broadlink IR frame is made of a type byte (0x26 for IR), a repeat count,
+the little endian length of the timings and the timings themselves: the
+alternating pulse and space durations, in units of 269/8192 ms, each one
+written as one byte or, when longer than 255 units, as 0x00 followed by
+two big endian bytes.
+
+Codes can be converted from and to lists of durations in microseconds,
+Pronto hex strings and raw timing strings (durations in microseconds, e.g.
+`+9000 -4500 560 -560`). Whole frames are converted at once: the timings are
+split with one regular expression scan and scaled with list
+comprehensions.
+"""
+import re
+import struct
+
+IR_TYPE = 0x26
+TICK = 269 / 8.192
+PRONTO_CLOCK = 0.241246
+DEFAULT_FREQUENCY = 38000
+HEADER_SIZE = 4
+MAX_TIMING = 0xffff
+MAX_JOINED_SIZE = 1024
+
+TIMING_RE = re.compile(b'\x00..|[^\x00]', re.S)
+RAW_RE = re.compile(r'[-+]?\d+')
+
+_BYTES = [bytes([i]) for i in range(256)]
+
+
+def set_repeat(packet, num):
+    """Return packet with its repeat count set to num (0 - 255)."""
+    return packet[0:1] + bytes([min(max(num, 0), 255)]) + packet[2:]
+
+
+def decode_packet(packet):
+    """Return the durations (microseconds) of a Broadlink frame."""
+    if len(packet) < HEADER_SIZE:
+        raise ValueError('Frame too short')
+    size = struct.unpack_from('<H', packet, 2)[0]
+    data = packet[HEADER_SIZE:HEADER_SIZE + size]
+    if len(data) < size:
+        raise ValueError('Truncated frame')
+    chunks = TIMING_RE.findall(data)
+    if sum(map(len, chunks)) != size:
+        raise ValueError('Malformed frame')
+    return [round((c[0] or (c[1] << 8 | c[2])) * TICK) for c in chunks]
+
+
+def encode_packet(durations, repeat=0, ir_type=IR_TYPE):
+    """Return the Broadlink frame of the durations (microseconds)."""
+    ticks = [min(max(int(round(abs(d) / TICK)), 1), MAX_TIMING) for d in durations]
+    data = b''.join([_BYTES[t] if t < 256 else bytes([0, t >> 8, t & 0xff]) for t in ticks])
+    if len(data) > MAX_TIMING:
+        raise ValueError('Too many timings')
+    return bytes([ir_type, repeat & 0xff]) + struct.pack('<H', len(data)) + data
+
+
+def join_packets(packets, gaps, repeat=0):
+    """Return one frame playing packets one after the other.
+
+    gaps[i] is the time (microseconds) from the start of packets[i] to the
+    start of packets[i + 1]: it is put in the trailing space of packets[i],
+    which is kept when it is longer. A packet with a repeat count is played
+    that many more times, back to back. Return the frame and the time
+    (microseconds) at which its last packet starts. Raise ValueError when a
+    packet is not IR, or when a gap or the frame is too long for a Broadlink
+    frame.
+    """
+    durations = []
+    start = last_start = 0
+    for i, packet in enumerate(packets):
+        if packet[0] != IR_TYPE:
+            raise ValueError('Not an IR frame')
+        frame = decode_packet(packet)
+        if not frame:
+            raise ValueError('Empty frame')
+        if packet[1]:
+            if len(frame) % 2:
+                frame.append(0)
+            frame = frame * (packet[1] + 1)
+        if i < len(packets) - 1:
+            if len(frame) % 2:
+                frame.append(0)
+            frame[-1] = max(frame[-1], gaps[i] - sum(frame[:-1]))
+            if frame[-1] > MAX_TIMING * TICK:
+                raise ValueError('Gap too long')
+        durations.extend(frame)
+        last_start = start
+        start += sum(frame)
+    packet = encode_packet(durations, repeat)
+    if len(packet) > MAX_JOINED_SIZE:
+        raise ValueError('Frame too long')
+    return packet, last_start
+
+
+def decode_pronto(code):
+    """Return the durations (microseconds) and carrier frequency of a Pronto hex code.
+
+    Both the once and the repeat sequences are returned, one after the other.
+    """
+    words = [int(w, 16) for w in code.split()]
+    if len(words) < 4 or words[0] != 0 or not words[1]:
+        raise ValueError('Only learned (0000) Pronto codes are supported')
+    once, repeat = words[2], words[3]
+    if len(words) != 4 + 2 * (once + repeat):
+        raise ValueError('Pronto code length mismatch')
+    unit = words[1] * PRONTO_CLOCK
+    return [round(w * unit) for w in words[4:]], round(1000000 / unit)
+
+
+def encode_pronto(durations, frequency=DEFAULT_FREQUENCY):
+    """Return the Pronto hex code of the durations (one once sequence)."""
+    if len(durations) % 2:
+        durations = list(durations) + [durations[-1]]
+    fword = int(round(1000000 / (frequency * PRONTO_CLOCK)))
+    unit = fword * PRONTO_CLOCK
+    words = [0, fword, len(durations) // 2, 0] + \
+        [min(max(int(round(abs(d) / unit)), 1), MAX_TIMING) for d in durations]
+    return ' '.join(['%04X' % w for w in words])
+
+
+def parse_timings(text):
+    """Return the durations of a raw timing string (signs are ignored)."""
+    durations = [abs(int(t)) for t in RAW_RE.findall(text)]
+    if not durations:
+        raise ValueError('No timing found')
+    return durations
+
+
+def format_timings(durations):
+    """Return the raw timing string of the durations (+pulse -space)."""
+    return ' '.join([('+%d' if i % 2 == 0 else '-%d') % d for i, d in enumerate(durations)])
+
+
+def pronto_to_packet(code, repeat=0):
+    return encode_packet(decode_pronto(code)[0], repeat)
+
+
+def packet_to_pronto(packet, frequency=DEFAULT_FREQUENCY):
+    return encode_pronto(decode_packet(packet), frequency)
+
@@ -0,0 +1,150 @@
+# Copied into broadlink_asyncio, gocomma and orvibo_asyncio: keep the
+# copies identical (see check_shared.py at the top of the repository).
+"""Command string compiler used by the IR remote platforms."""
+import logging
+import re
+import sys
+from collections import OrderedDict
+from collections.abc import Mapping
+
+_LOGGER = logging.getLogger(__name__)
+
+DEFAULT_PLAN_CACHE_SIZE = 256
+
+CH_RE = re.compile(r"^(([a-zA-Z0-9_]*)@)?ch([0-9]+)$")
+REPEAT_RE = re.compile(r"^((?:[a-zA-Z0-9_]*@)?[a-zA-Z0-9_]+)#([0-9]+)$")
+
+
+class CommandStore(object):
+    """The codes of all the remotes of a device, each distinct code held once.
+
+    The configured and the learned tables (remote -> key -> commands) are
+    merged, the learned keys winning. Each command goes through compact
+    (e.g. to decode it to bytes) and equal results are shared, as are the
+    key names. The tables of the entities are views: view() is the table of
+    the main entity (`remote@key` names), view(remote) the one of a remote.
+    """
+
+    def __init__(self, remotes, learned, compact=None):
+        self._codes = dict()
+        self._compact = compact
+        self._remotes = dict()
+        for remnm in dict.fromkeys(list(remotes) + list(learned)):
+            merged = dict(remotes.get(remnm, dict()))
+            merged.update(learned.get(remnm, dict()))
+            self._remotes[sys.intern(remnm)] = dict(
+                (sys.intern(keynm), tuple(self._intern(c) for c in keycmnds))
+                for keynm, keycmnds in merged.items())
+
+    def __len__(self):
+        """Return the number of distinct codes."""
+        return len(self._codes)
+
+    @property
+    def remotes(self):
+        return list(self._remotes)
+
+    def view(self, remote=None):
+        return CommandView(self._remotes, remote)
+
+    def _intern(self, command):
+        if self._compact is not None:
+            command = self._compact(command)
+        return self._codes.setdefault(command, command)
+
+
+class CommandView(Mapping):
+    """Read only table of an entity, looking the codes up in a CommandStore."""
+
+    def __init__(self, remotes, remote=None):
+        self._remotes = remotes
+        self._remote = remote
+
+    def __getitem__(self, name):
+        if self._remote is not None:
+            return self._remotes[self._remote][name]
+        remnm, sep, keynm = name.partition('@')
+        try:
+            return self._remotes[remnm][keynm]
+        except KeyError:
+            raise KeyError(name)
+
+    def __iter__(self):
+        if self._remote is not None:
+            return iter(self._remotes[self._remote])
+        return (remnm + '@' + keynm for remnm, table in self._remotes.items() for keynm in table)
+
+    def __len__(self):
+        if self._remote is not None:
+            return len(self._remotes[self._remote])
+        return sum(len(table) for table in self._remotes.values())
+
+
+class CommandCompiler(object):
+    """Turn command strings into execution plans and cache them.
+
+    A plan is the tuple of payloads to send for a command string: each item
+    is either a payload or a (payload, num) tuple when the payload has to be
+    repeated num times. Supported command strings are `key`, `remote@key`,
+    `ch123` / `remote@ch123`, `key#N` / `remote@key#N` and `@raw`. Anything else is handed to
+    the decode function as a raw command.
+    """
+
+    def __init__(self, commands, decode, maxsize=DEFAULT_PLAN_CACHE_SIZE):
+        self._commands = commands
+        self._decode = decode
+        self._maxsize = maxsize
+        self._plans = OrderedDict()
+
+    @property
+    def commands(self):
+        """Return the command table plans are compiled against."""
+        return self._commands
+
+    @commands.setter
+    def commands(self, value):
+        """Replace the command table, invalidating every cached plan."""
+        self._commands = value
+        self.invalidate()
+
+    def invalidate(self):
+        self._plans.clear()
+
+    def get(self, command):
+        plan = self._plans.get(command)
+        if plan is None:
+            plan = self.compile(command)
+            self._plans[command] = plan
+            if len(self._plans) > self._maxsize:
+                self._plans.popitem(last=False)
+        else:
+            self._plans.move_to_end(command)
+        return plan
+
+    def compile(self, command):
+        _LOGGER.info("Compiling %s", command)
+        commands = self._commands
+        if command in commands:
+            return tuple(commands[command])
+        elif command.startswith('@'):
+            return tuple(self._decode(command[1:]))
+        mo = CH_RE.match(command)
+        if mo is not None:
+            pre = mo.group(1) or ''
+            if pre + 'ch1' in commands:
+                try:
+                    return tuple(commands[pre + 'ch' + x][0] for x in mo.group(3))
+                except KeyError as ex:
+                    _LOGGER.error("%s: digit key %s not found", command, ex)
+                    return tuple()
+        mo = REPEAT_RE.match(command)
+        if mo is not None:
+            nm = mo.group(1)
+            num = int(mo.group(2))
+            if nm in commands:
+                _LOGGER.info("%s found in commands (rep %d)", nm, num)
+                return tuple((c, num) for c in commands[nm])
+            else:
+                _LOGGER.error("%s not found in commands", nm)
+                return tuple()
+        return tuple(self._decode(command))
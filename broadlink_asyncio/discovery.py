@@ -0,0 +1,105 @@
+"""Discovery of the Broadlink devices on the LAN."""
+import asyncio
+import logging
+import socket
+
+_LOGGER = logging.getLogger(__name__)
+
+DEFAULT_BROADCAST_ADDRESS = '255.255.255.255'
+DEVICE_TTL = 3600
+RESOLVE_INTERVAL = 300
+
+
+def get_discovery(hassdata):
+    """Return the discovery cache shared by the entities."""
+    if __name__ not in hassdata:
+        hassdata[__name__] = BroadlinkDiscovery()
+    return hassdata[__name__]
+
+
+def local_ip_for(broadcast_address):
+    """Return the IP of the interface used to reach broadcast_address."""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+        sock.connect((broadcast_address, 80))
+        return sock.getsockname()[0]
+    finally:
+        sock.close()
+
+
+def subnet_broadcast(host):
+    """Return the /24 broadcast address of host (None if not an IPv4 address)."""
+    parts = host.split('.')
+    if len(parts) != 4 or not all(p.isdigit() for p in parts):
+        return None
+    return '.'.join(parts[:3] + ['255'])
+
+
+class BroadlinkDiscovery(object):
+    """Cache of the Broadlink devices found on the LAN, keyed by MAC.
+
+    The hello broadcasts of a discovery are sent on all the given broadcast
+    addresses (each one from the interface that reaches it) at the same
+    time, and the replies are collected until the common timeout. Concurrent
+    discoveries with the same parameters share the running one. Devices not seen for DEVICE_TTL
+    seconds are dropped.
+    """
+
+    def __init__(self):
+        self._devices = dict()
+        self._running = dict()
+        self._last_resolve = dict()
+        self.known = set()
+
+    def __len__(self):
+        return len(self._devices)
+
+    async def async_discover(self, broadcast_addresses, timeout, local_ip=None):
+        """Discover the devices; return the dict mac -> device of the cache."""
+        key = (tuple(broadcast_addresses), timeout, local_ip)
+        task = self._running.get(key)
+        if task is None:
+            task = asyncio.get_event_loop().create_task(
+                self._discover(key, broadcast_addresses, timeout, local_ip))
+            self._running[key] = task
+        await asyncio.shield(task)
+        return self.devices()
+
+    async def _discover(self, key, broadcast_addresses, timeout, local_ip):
+        from pybroadlink.broadlink_udp import BroadlinkUDP
+        try:
+            jobs = []
+            for address in broadcast_addresses:
+                try:
+                    ip = local_ip or local_ip_for(address)
+                except OSError as ex:
+                    _LOGGER.error("No interface for %s: %s", address, ex)
+                    continue
+                jobs.append(BroadlinkUDP.discovery(ip, address, timeout, retry=1))
+            now = asyncio.get_event_loop().time()
+            for hosts in await asyncio.gather(*jobs, return_exceptions=True):
+                if isinstance(hosts, Exception):
+                    _LOGGER.error("Discovery error %s", hosts)
+                    continue
+                for dev in hosts.values():
+                    self._devices[dev._mac] = (dev, now)
+        finally:
+            del self._running[key]
+
+    def devices(self):
+        """Return the dict mac -> device of the devices seen lately."""
+        now = asyncio.get_event_loop().time()
+        for mac, (_, seen) in list(self._devices.items()):
+            if now - seen > DEVICE_TTL:
+                del self._devices[mac]
+        return dict((mac, dev) for mac, (dev, _) in self._devices.items())
+
+    async def async_resolve(self, mac, broadcast_addresses, timeout):
+        """Return the device with mac (or None), discovering at most every RESOLVE_INTERVAL."""
+        loop = asyncio.get_event_loop()
+        last = self._last_resolve.get(mac)
+        if last is None or loop.time() - last >= RESOLVE_INTERVAL:
+            self._last_resolve[mac] = loop.time()
+            await self.async_discover(broadcast_addresses, timeout)
+        return self.devices().get(mac)
@@ -1,23 +1,38 @@
 """Support for the Xiaomi IR Remote (Chuangmi IR)."""
-import logging
 import asyncio
+import logging
 from datetime import timedelta
-import re
+from functools import partial
 
 import voluptuous as vol
 import binascii
 from base64 import b64decode, b64encode
 
 from homeassistant.components.remote import (
-    PLATFORM_SCHEMA, DOMAIN, ATTR_NUM_REPEATS, ATTR_DELAY_SECS,
-    DEFAULT_DELAY_SECS, RemoteDevice, ATTR_HOLD_SECS, DEFAULT_HOLD_SECS)
+    PLATFORM_SCHEMA, DOMAIN, ATTR_NUM_REPEATS, ATTR_DELAY_SECS, ATTR_COMMAND,
+    DEFAULT_DELAY_SECS, RemoteDevice, ATTR_HOLD_SECS, DEFAULT_HOLD_SECS,
+    DEFAULT_NUM_REPEATS)
 from homeassistant.const import (
     CONF_NAME, CONF_HOST, CONF_MAC, CONF_TIMEOUT,
     ATTR_ENTITY_ID, STATE_OFF, STATE_ON)
+from homeassistant.core import callback
 import homeassistant.helpers.config_validation as cv
-from homeassistant.util import Throttle
-
-MIN_TIME_BETWEEN_UPDATES = timedelta(minutes=30)
+from homeassistant.helpers.event import async_track_state_change
+from .codec import (decode_packet, decode_pronto, encode_packet,
+                    join_packets, parse_timings, set_repeat)
+from .coalescer import COALESCE_SCHEMA, Coalescer, split_repeat
+from .commands import CommandCompiler, CommandStore, DEFAULT_PLAN_CACHE_SIZE
+from .discovery import DEFAULT_BROADCAST_ADDRESS, get_discovery, subnet_broadcast
+from .fanout import async_register_fanout
+from .fingerprint import CodeIndex
+from .health import HealthMonitor, get_health_monitor
+from .learning import LearningSession
+from .scheduler import (SendScheduler, PRIORITIES, PRIORITY_BACKGROUND,
+                        PRIORITY_INTERACTIVE)
+from .session import async_check_session, async_get_sessions, has_session
+from .store import LearnedStore
+
+HEALTH_CHECK_INTERVAL = timedelta(minutes=5)
 
 REQUIREMENTS = ['pybroadlink>=1.0']
 
@@ -29,20 +44,96 @@ STATE_LEARNING_OK = "learning_ok"
 STATE_LEARNING_KEY = "learning_key"
 
 SERVICE_LEARN = 'broadlink_asyncio_learn'
+SERVICE_SEND = 'broadlink_asyncio_send'
+SERVICE_ABORT = 'broadlink_asyncio_abort'
+SERVICE_DEDUP = 'broadlink_asyncio_dedup'
+SERVICE_IMPORT = 'broadlink_asyncio_import'
+SERVICE_DISCOVERY = 'broadlink_asyncio_discovery'
 DATA_KEY = 'remote.broadlink_asyncio'
 
 CONF_REMOTES = 'remotes'
 CONF_KEYS = 'keys'
+CONF_PRIORITY = 'priority'
+CONF_SUPERSEDE = 'supersede'
+CONF_REMOTE = 'remote'
+CONF_SINGLE_FRAME = 'single_frame'
+CONF_COALESCE = 'coalesce'
+CONF_BROADCAST_ADDRESS = 'broadcast_address'
+CONF_LOCAL_IP = 'local_ip'
 
 DEFAULT_TIMEOUT = 5
+DEFAULT_LEARNED_REMOTE = 'learned'
+RESOLVE_TIMEOUT = 3
 
 LEARN_COMMAND_SCHEMA = vol.Schema({
     vol.Required(ATTR_ENTITY_ID): vol.All(str),
     vol.Optional(CONF_TIMEOUT, default=30): vol.All(int, vol.Range(min=10)),
-    vol.Optional(CONF_KEYS, default=["NA_1"]): vol.All(cv.ensure_list, [cv.slug])
+    vol.Optional(CONF_KEYS, default=["NA_1"]): vol.All(cv.ensure_list, [cv.slug]),
+    vol.Optional(CONF_REMOTE): cv.slug
+})
+
+
+def decode_command_string(cmd):
+    """Convert a command string into the object sent to the Broadlink RM.
+
+    `r` (base64) and `h` (hex) strings become bytes, as well as `p` (Pronto
+    hex) and `u` (raw timings in microseconds) strings, converted to Broadlink
+    IR frames. `t` strings become the float number of seconds to wait.
+    """
+    pid = cmd[0:1]
+    packet = cmd[1:]
+    try:
+        if pid == 'r':
+            extra = len(packet) % 4
+            if extra > 0:
+                packet = packet + ('=' * (4 - extra))
+            return b64decode(packet, validate=True)
+        elif pid == 'h':
+            return binascii.unhexlify(packet)
+        elif pid == 't':
+            return float(packet)
+        elif pid == 'p':
+            return encode_packet(decode_pronto(packet)[0])
+        elif pid == 'u':
+            return encode_packet(parse_timings(packet))
+    except (ValueError, binascii.Error) as ex:
+        raise vol.Invalid('Invalid command string %s: %s' % (cmd, ex))
+    raise vol.Invalid('Invalid command string %s: unknown prefix' % cmd)
+
+
+SEND_COMMAND_SCHEMA = vol.Schema({
+    vol.Required(ATTR_ENTITY_ID): vol.All(str),
+    vol.Required(ATTR_COMMAND): vol.All(cv.ensure_list, [cv.string]),
+    vol.Optional(ATTR_NUM_REPEATS, default=DEFAULT_NUM_REPEATS): cv.positive_int,
+    vol.Optional(ATTR_DELAY_SECS, default=DEFAULT_DELAY_SECS): vol.Coerce(float),
+    vol.Optional(ATTR_HOLD_SECS, default=DEFAULT_HOLD_SECS): vol.Coerce(float),
+    vol.Optional(CONF_PRIORITY): vol.In(PRIORITIES),
+    vol.Optional(CONF_SUPERSEDE, default=False): cv.boolean,
+    vol.Optional(CONF_SINGLE_FRAME): cv.boolean,
+})
+
+ABORT_COMMAND_SCHEMA = vol.Schema({
+    vol.Required(ATTR_ENTITY_ID): vol.All(str),
+})
+
+DEDUP_COMMAND_SCHEMA = vol.Schema({
+    vol.Required(ATTR_ENTITY_ID): vol.All(str),
 })
 
-COMMAND_SCHEMA = vol.All(cv.ensure_list, [cv.string])
+IMPORT_COMMAND_SCHEMA = vol.Schema({
+    vol.Required(ATTR_ENTITY_ID): vol.All(str),
+    vol.Optional(CONF_REMOTE): cv.slug,
+    vol.Required(CONF_KEYS): cv.schema_with_slug_keys(vol.All(cv.ensure_list, [cv.string])),
+})
+
+DISCOVERY_COMMAND_SCHEMA = vol.Schema({
+    vol.Optional(CONF_TIMEOUT, default=5): vol.All(int, vol.Range(min=1)),
+    vol.Optional(CONF_BROADCAST_ADDRESS, default=[DEFAULT_BROADCAST_ADDRESS]):
+        vol.All(cv.ensure_list, [cv.string]),
+    vol.Optional(CONF_LOCAL_IP): cv.string,
+})
+
+COMMAND_SCHEMA = vol.All(cv.ensure_list, [vol.All(cv.string, decode_command_string)])
 
 KEYS_SCHEMA = cv.schema_with_slug_keys(COMMAND_SCHEMA)
 
@@ -52,11 +143,93 @@ PLATFORM_SCHEMA = PLATFORM_SCHEMA.extend({
     vol.Required(CONF_MAC): cv.string,
     vol.Optional(CONF_TIMEOUT, default=DEFAULT_TIMEOUT):
         vol.All(int, vol.Range(min=1)),
+    vol.Optional(CONF_SINGLE_FRAME, default=False): cv.boolean,
     vol.Optional(CONF_REMOTES, default={}):
         cv.schema_with_slug_keys(KEYS_SCHEMA),
+    vol.Optional(CONF_COALESCE, default=[]): COALESCE_SCHEMA,
 }, extra=vol.ALLOW_EXTRA)
 
 
+def merge_commands(remotes, learned):
+    """Merge the learned codes into the configured ones.
+
+    Command strings are already decoded by COMMAND_SCHEMA and by the store:
+    here they are held once in a CommandStore, whose read only views are the
+    tables of the entities, so that each send only deals with bytes. Return
+    the table of the main entity (`remote@key` names) and the tables of the
+    remotes.
+    """
+    cmdstore = CommandStore(remotes, learned)
+    return cmdstore.view(), dict((remnm, cmdstore.view(remnm)) for remnm in cmdstore.remotes)
+
+
+def learned_listener(remotes, store, main, children):
+    """Return the store listener hot merging the learned codes into the tables."""
+    @callback
+    def async_learned_changed():
+        allcmnds, remtables = merge_commands(remotes, store.remotes)
+        main.commands = allcmnds
+        for remnm, child in children.items():
+            child.commands = remtables[remnm]
+    return async_learned_changed
+
+
+def device_probe(device, discovery, broadcast_addresses, sessions, devtype=None):
+    """Return the health probe of device: session check, looking for a new IP on failure.
+
+    A session the device already has (e.g. restored at startup) is checked
+    with one cheap request and kept while the device accepts it: a new one
+    is negotiated only when the device refuses it or has none.
+
+    After a DHCP lease change the device no longer answers at its IP: it is
+    looked for by MAC (at most every RESOLVE_INTERVAL) in the background, so
+    that the discovery does not hold the send queue, and only a device of
+    the same type is taken (devtype, or any type of the same class when
+    devtype is None, e.g. for a configured device). The next probe moves
+    the device to the IP found before authenticating again. pybroadlink has
+    no setter for the address, hence the private fields. The new session
+    is saved in sessions.
+    """
+    from pybroadlink.broadlink_udp import BroadlinkUDP
+    state = dict(resolving=None, hp=None)
+
+    async def resolve():
+        found = await discovery.async_resolve(device._mac, broadcast_addresses, RESOLVE_TIMEOUT)
+        if found is None or found._hp[0] == device._hp[0]:
+            return
+        if type(found) is not type(device) or\
+                (devtype is not None and found._devtype != devtype):
+            _LOGGER.error("%s found at %s with type 0x%04x: not moved",
+                          BroadlinkUDP.print_mac(device._mac), found._hp[0], found._devtype)
+            return
+        state['hp'] = found._hp
+
+    async def probe():
+        hp = state['hp']
+        if hp is not None:
+            state['hp'] = None
+            _LOGGER.warning("%s moved from %s to %s", BroadlinkUDP.print_mac(device._mac),
+                            device._hp[0], hp[0])
+            device.destroy_remote()
+            device._hp = hp
+            device._local_addr = ''
+        if has_session(device):
+            ok = await async_check_session(device)
+            if ok is False:
+                _LOGGER.info("%s refused the session, authenticating again",
+                             BroadlinkUDP.print_mac(device._mac))
+                ok = await device.auth()
+        else:
+            ok = await device.auth()
+        if ok:
+            sessions.async_save(device)
+            return True
+        if state['resolving'] is None or state['resolving'].done():
+            state['resolving'] = asyncio.get_event_loop().create_task(resolve())
+        return False
+    return probe
+
+
 async def async_setup_platform(hass, config, async_add_entities,
                                discovery_info=None):
     """Set up the Xiaomi IR Remote (Chuangmi IR) platform."""
@@ -77,21 +250,43 @@ async def async_setup_platform(hass, config, async_add_entities,
 
     friendly_name = config.get(CONF_NAME)
     timeout = config.get(CONF_TIMEOUT)
+    single_frame = config.get(CONF_SINGLE_FRAME)
     device = BroadlinkRM3((ip_addr, PORT), mac_addr, timeout=timeout)
 
-    # cmnds = fill_commands(config.get(CONF_COMMANDS)
     remotes = config.get(CONF_REMOTES)
-    allcmnds = dict()
-    for remnm, remkeys in remotes.items():
-        for keynm, keycmnds in remkeys.items():
-            allcmnds[remnm + "@" + keynm] = keycmnds
-    xiaomi_miio_remote = BroadlinkRemote(friendly_name, device, allcmnds, '')
+    discovery = get_discovery(hass.data)
+    discovery.known.add(mac_addr)
+    sessions = await async_get_sessions(hass)
+    broadcasts = [DEFAULT_BROADCAST_ADDRESS]
+    if subnet_broadcast(ip_addr):
+        broadcasts.append(subnet_broadcast(ip_addr))
+    store = LearnedStore(hass, DATA_KEY + "." + friendly_name, BroadlinkRemote.decode_raw)
+    await store.async_load()
+    allcmnds, remtables = merge_commands(remotes, store.remotes)
+    # One health monitor (and send scheduler) per device, whatever the number
+    # of entities using it: keyed by MAC, which does not change when the
+    # device moves to another IP
+    health = get_health_monitor(hass.data, binascii.hexlify(mac_addr).decode('utf8'), partial(
+        HealthMonitor, friendly_name, device_probe(device, discovery, broadcasts, sessions),
+        SendScheduler(friendly_name), HEALTH_CHECK_INTERVAL.total_seconds()))
+    scheduler = health.scheduler
+    # No auth handshake at startup when the last session can be reused
+    await sessions.async_restore(device)
+    coalescer = Coalescer(config.get(CONF_COALESCE)) if config.get(CONF_COALESCE) else None
+    xiaomi_miio_remote = BroadlinkRemote(friendly_name, device, allcmnds, '', scheduler, health, store,
+                                         single_frame, coalescer)
     hass.data[DATA_KEY][friendly_name] = xiaomi_miio_remote
     lstent = [xiaomi_miio_remote]
-    for remnm, remkeys in remotes.items():
-        xiaomi_miio_remote = BroadlinkRemote(friendly_name+"_"+remnm, device, remkeys, friendly_name)
+    children = dict()
+    for remnm, remkeys in remtables.items():
+        xiaomi_miio_remote = BroadlinkRemote(friendly_name+"_"+remnm, device, remkeys, friendly_name, scheduler, health, store,
+                                             single_frame, coalescer)
+        hass.data[DATA_KEY][friendly_name+"_"+remnm] = xiaomi_miio_remote
         lstent.append(xiaomi_miio_remote)
+        children[remnm] = xiaomi_miio_remote
     async_add_entities(lstent)
+    store.add_listener(learned_listener(remotes, store, lstent[0], children))
+    async_register_fanout(hass)
 
     async def async_service_handler(service):
         """Handle a learn command."""
@@ -110,56 +305,156 @@ async def async_setup_platform(hass, config, async_add_entities,
 
         timeout = service.data.get(CONF_TIMEOUT, 30)
         keynames = service.data.get(CONF_KEYS, ["NA_1"])
-        numkeys = len(keynames)
+        remote = service.data.get(CONF_REMOTE) or entity.remote or DEFAULT_LEARNED_REMOTE
         pn = hass.components.persistent_notification
-        allnot = ''
-        msg = ''
 
-        for xx in range(numkeys):
-            try:
-                if await entity.enter_learning_mode():
-                    await asyncio.sleep(3)
-                    keyname = keynames[xx]
-                    msg = "Press the key you want Home Assistant to learn [%s] %d/%d" % (keyname, xx+1, numkeys)
-                    _LOGGER.info(msg)
-                    pn.async_create(msg, title='Broadlink RM', notification_id='broadlink_asyncio_learning')
-                    packet = await entity.get_learned_key(timeout, keyname)
-                    if packet:
-                        b64k = b64encode(packet).decode('utf8')
-                        notif = '{}:\n    - "r{}"\n'.format(keyname, b64k)
-                        msg = "Received is: r{} or h{}".format(b64k, binascii.hexlify(packet).decode('utf8'))
-                    else:
-                        notif = ''
-                        msg = "Did not receive any key"
-                    _LOGGER.info(msg)
-                    allnot += notif + '\n'
-                    pn.async_create(allnot, title='Broadlink RM', notification_id='broadlink_asyncio_learned')
-                    pn.async_dismiss(notification_id='broadlink_asyncio_learning')
-                else:
-                    msg = "Failed entering learning mode"
-                    _LOGGER.error(msg)
-                    pn.async_create(msg, title='Broadlink RM', notification_id='broadlink_asyncio_learning')
-            except BaseException as ex:
-                _LOGGER.error("Learning error %s", ex)
-        msg = "Learning ends NOW"
-        _LOGGER.info(msg)
-        await entity.exit_learning_mode()
+        def prompt(keyname, xx, numkeys):
+            msg = "Press the key you want Home Assistant to learn [%s] %d/%d" % (keyname, xx+1, numkeys)
+            _LOGGER.info(msg)
+            pn.async_create(msg, title='Broadlink RM', notification_id='broadlink_asyncio_learning')
+
+        # The device leaves learning mode after each key: the session puts it
+        # back in learning mode right after each capture
+        session = LearningSession(entity, timeout, remote, rearm=True)
+        try:
+            if not await session.run(keynames, prompt):
+                msg = "Failed entering learning mode"
+                _LOGGER.error(msg)
+                pn.async_create(msg, title='Broadlink RM', notification_id='broadlink_asyncio_learning')
+                return
+        except Exception as ex:
+            _LOGGER.error("Learning error %s", ex)
+        pn.async_dismiss(notification_id='broadlink_asyncio_learning')
+        pn.async_create(session.notification(), title='Broadlink RM', notification_id='broadlink_asyncio_learned')
+        _LOGGER.info("Learning ends NOW: %d/%d keys learned", len(session.learned), len(keynames))
 
     hass.services.async_register(DOMAIN, SERVICE_LEARN, async_service_handler,
                                  schema=LEARN_COMMAND_SCHEMA)
 
+    async def async_import_service_handler(service):
+        """Handle an import command."""
+        entity_id = service.data.get(ATTR_ENTITY_ID)
+        if entity_id.startswith("remote."):
+            entity_id = entity_id[len("remote."):]
+        if entity_id not in hass.data[DATA_KEY]:
+            _LOGGER.error("entity_id: '%s' not found", entity_id)
+            return
+        entity = hass.data[DATA_KEY][entity_id]
+        remote = service.data.get(CONF_REMOTE) or entity.remote or DEFAULT_LEARNED_REMOTE
+        keys = service.data.get(CONF_KEYS)
+        failed = entity.store.async_add_keys(remote, keys)
+        msg = "Imported %d/%d keys in %s" % (len(keys) - len(failed), len(keys), remote)
+        if failed:
+            msg += ". Invalid codes: " + ", ".join(failed)
+        _LOGGER.info(msg)
+        hass.components.persistent_notification.async_create(
+            msg, title='Broadlink RM', notification_id='broadlink_asyncio_import')
+
+    hass.services.async_register(DOMAIN, SERVICE_IMPORT, async_import_service_handler,
+                                 schema=IMPORT_COMMAND_SCHEMA)
+
+    async def async_send_service_handler(service):
+        """Handle a send or abort command."""
+        entity_id = service.data.get(ATTR_ENTITY_ID)
+        if entity_id.startswith("remote."):
+            entity_id = entity_id[len("remote."):]
+        if entity_id not in hass.data[DATA_KEY]:
+            _LOGGER.error("entity_id: '%s' not found", entity_id)
+            return
+        entity = hass.data[DATA_KEY][entity_id]
+        if service.service == SERVICE_ABORT:
+            entity.scheduler.abort()
+        else:
+            kwargs = dict(service.data)
+            del kwargs[ATTR_ENTITY_ID]
+            await entity.async_send_command(kwargs.pop(ATTR_COMMAND), **kwargs)
+
+    hass.services.async_register(DOMAIN, SERVICE_SEND, async_send_service_handler,
+                                 schema=SEND_COMMAND_SCHEMA)
+    hass.services.async_register(DOMAIN, SERVICE_ABORT, async_send_service_handler,
+                                 schema=ABORT_COMMAND_SCHEMA)
+
+    async def async_dedup_service_handler(service):
+        """Handle a dedup command."""
+        entity_id = service.data.get(ATTR_ENTITY_ID)
+        if entity_id.startswith("remote."):
+            entity_id = entity_id[len("remote."):]
+        if entity_id not in hass.data[DATA_KEY]:
+            _LOGGER.error("entity_id: '%s' not found", entity_id)
+            return
+        entity = hass.data[DATA_KEY][entity_id]
+        groups = entity.index.duplicates()
+        if groups:
+            msg = "Keys with the same code:\n" + "\n".join([" = ".join(g) for g in groups])
+        else:
+            msg = "No duplicate key found among %d codes" % len(entity.index)
+        _LOGGER.info(msg)
+        hass.components.persistent_notification.async_create(
+            msg, title='Broadlink RM', notification_id='broadlink_asyncio_dedup')
+
+    hass.services.async_register(DOMAIN, SERVICE_DEDUP, async_dedup_service_handler,
+                                 schema=DEDUP_COMMAND_SCHEMA)
+
+    async def async_discovery_service_handler(service):
+        """Handle a discovery command."""
+        broadcasts = service.data.get(CONF_BROADCAST_ADDRESS)
+        devices = await discovery.async_discover(
+            broadcasts, service.data.get(CONF_TIMEOUT), service.data.get(CONF_LOCAL_IP))
+        new_remotes = []
+        msg = ''
+        for mac, dev in devices.items():
+            name = "b_" + binascii.hexlify(mac).decode('utf8')
+            if mac in discovery.known:
+                msg += "Re-Discovered Broadlink device %s\n" % dev
+                continue
+            msg += "Discovered new Broadlink device %s: %s\n" % (dev, name)
+            discovery.known.add(mac)
+            health = get_health_monitor(hass.data, name[2:], partial(
+                HealthMonitor, name, device_probe(dev, discovery, broadcasts, sessions, dev._devtype),
+                SendScheduler(name), HEALTH_CHECK_INTERVAL.total_seconds()))
+            await sessions.async_restore(dev)
+            store = LearnedStore(hass, DATA_KEY + "." + name, BroadlinkRemote.decode_raw)
+            await store.async_load()
+            allcmnds, _ = merge_commands(dict(), store.remotes)
+            xiaomi_miio_remote = BroadlinkRemote(name, dev, allcmnds, '', health.scheduler, health, store,
+                                                 single_frame)
+            store.add_listener(learned_listener(dict(), store, xiaomi_miio_remote, dict()))
+            new_remotes.append(xiaomi_miio_remote)
+            hass.data[DATA_KEY][name] = xiaomi_miio_remote
+        if not msg:
+            msg = "No Broadlink device found"
+        _LOGGER.info(msg)
+        hass.components.persistent_notification.async_create(
+            msg, title='Broadlink RM', notification_id='broadlink_asyncio_discovery')
+        if new_remotes:
+            async_add_entities(new_remotes)
+
+    hass.services.async_register(DOMAIN, SERVICE_DISCOVERY, async_discovery_service_handler,
+                                 schema=DISCOVERY_COMMAND_SCHEMA)
+
 
 class BroadlinkRemote(RemoteDevice):
     """Representation of a Xiaomi Miio Remote device."""
 
-    def __init__(self, friendly_name, device, commands, main_entity):
+    def __init__(self, friendly_name, device, commands, main_entity, scheduler, health, store,
+                 single_frame=False, coalescer=None):
         """Initialize the remote."""
         self._name = friendly_name
         self._device = device
+        self._scheduler = scheduler
+        self._health = health
+        self._store = store
+        self._sessions = None
         self._state = STATE_OFF
-        self._commands = commands
+        self._compiler = CommandCompiler(commands, self.decode_raw)
+        self._single_frame = single_frame
+        self._frames = dict()
+        self._index = CodeIndex(self.durations)
+        self._indexed = False
         self._states = dict(last_learned=dict(), key_to_learn='')
         self._main = main_entity
+        self._coalescer = coalescer
+        self._unsub_main = None
 
     @property
     def name(self):
@@ -183,11 +478,53 @@ class BroadlinkRemote(RemoteDevice):
 
     @property
     def should_poll(self):
-        """We should not be polled for device up state."""
+        """The health monitor pushes the state of the main entity, the others mirror it."""
+        return False
+
+    async def async_added_to_hass(self):
+        """Start following the health monitor or the state of the main entity."""
+        self._sessions = await async_get_sessions(self.hass)
+        if len(self._main):
+            self._unsub_main = async_track_state_change(
+                self.hass, "remote." + self._main, self._async_main_changed)
+            self._mirror_main(self.hass.states.get("remote." + self._main))
+        else:
+            self._unsub_main = self._health.add_listener(self._async_health_changed)
+
+    async def async_will_remove_from_hass(self):
+        """Stop following the state of the main entity."""
+        if self._unsub_main:
+            self._unsub_main()
+            self._unsub_main = None
+
+    @callback
+    def _async_main_changed(self, entity_id, old_state, new_state):
+        if self._mirror_main(new_state):
+            self.async_schedule_update_ha_state()
+
+    @callback
+    def _async_health_changed(self, online):
+        if self._state.startswith(STATE_LEARNING):
+            return
+        if online:
+            if self._state == STATE_OFF:
+                self._state = STATE_ON
+        else:
+            self._state = STATE_OFF
+            self._states['last_learned'] = dict()
+        _LOGGER.debug("New state is %s", self._state)
+        self.async_schedule_update_ha_state()
+
+    def _mirror_main(self, sto):
+        if sto is None:
+            return False
+        self._state = sto.state
+        self._states = dict(sto.attributes)
         return True
 
     async def enter_learning_mode(self, timeout=-1, retry=3):
         self._state = STATE_LEARNING_INIT
+        self._health.pause()
         # self._states['last_learned'] = dict()
         await self.async_update_ha_state()
         rv = await self._device.enter_learning_mode(timeout=timeout, retry=retry)
@@ -197,6 +534,7 @@ class BroadlinkRemote(RemoteDevice):
 
     async def exit_learning_mode(self, timeout=-1, retry=3):
         self._state = STATE_ON
+        self._health.resume()
         await self.async_update_ha_state()
         return True
 
@@ -205,33 +543,83 @@ class BroadlinkRemote(RemoteDevice):
         self._states['key_to_learn'] = keyname
         await self.async_update_ha_state()
         rv = await self._device.get_learned_key(timeout=timeout)
-        if rv:
-            self._states['last_learned'][keyname] = binascii.hexlify(rv).decode('utf8')
         self._state = STATE_LEARNING_OK
         self._states['key_to_learn'] = ''
         await self.async_update_ha_state()
         return rv
 
+    def clear_learned(self):
+        """Empty the last_learned attribute (at the start of a learning session)."""
+        self._states['last_learned'] = dict()
+
+    def save_learned_key(self, keyname, packet, remote):
+        """Save a learned key in the store of the device."""
+        self._store.async_add(remote, keyname, ['r' + b64encode(packet).decode('utf8')])
+        self._states['last_learned'][keyname] = remote + "@" + keyname
+
+    @property
+    def store(self):
+        """Return the store of the learned keys of the device."""
+        return self._store
+
+    @property
+    def remote(self):
+        """Return the remote of a child entity ('' for the main entity)."""
+        return self._name[len(self._main) + 1:] if len(self._main) else ''
+
+    @property
+    def commands(self):
+        """Return the command table."""
+        return self._compiler.commands
+
+    @commands.setter
+    def commands(self, value):
+        self._compiler.commands = value
+        self._frames.clear()
+        self._indexed = False
+
+    @property
+    def index(self):
+        """Return the fuzzy index of the codes of the command table."""
+        if not self._indexed:
+            self._index.rebuild(self._compiler.commands)
+            self._indexed = True
+        return self._index
+
+    def similar_keys(self, packet):
+        """Return the remote@key names of the codes that are near-duplicates of packet."""
+        fp = self.index.fingerprint(packet)
+        if fp is None:
+            return []
+        return [self._full_name(name) for name in self.index.find(fp)]
+
+    def closest_remote(self, packet):
+        """Return the remote whose codes look the most like packet and a 0 - 1 score."""
+        fp = self.index.fingerprint(packet)
+        if fp is None:
+            return None, 0.0
+        name, score = self.index.closest(fp)
+        if name is None:
+            return None, 0.0
+        return self._full_name(name).partition('@')[0], score
+
+    def _full_name(self, name):
+        return self.remote + "@" + name if len(self._main) else name
+
+    @property
+    def scheduler(self):
+        """Return the send scheduler shared by the entities of the device."""
+        return self._scheduler
+
     @property
     def device_state_attributes(self):
         """Hide remote by default."""
-        return self._states
+        return dict(self._states, learned_keys=len(self._store), send_queue=self._scheduler.metrics)
 
-    @Throttle(MIN_TIME_BETWEEN_UPDATES)
     async def async_update(self):
-        if len(self._main):
-            sto = self.hass.states.get("remote." + self._main)
-            self._state = sto.state
-            self._states = sto.attributes
-        else:
-            if not self._state.startswith(STATE_LEARNING):
-                if await self._device.auth():
-                    if self._state == STATE_OFF:
-                        self._state = STATE_ON
-                else:
-                    self._state = STATE_OFF
-                    self._states['last_learned'] = dict()
-                _LOGGER.debug("New state is %s", self._state)
+        """Probe the device now: only called when an update is forced."""
+        if not len(self._main):
+            await self._health.probe_now()
 
     async def async_turn_on(self, **kwargs):
         """Turn the device on."""
@@ -244,87 +632,177 @@ class BroadlinkRemote(RemoteDevice):
                       "please use 'remote.send_command' to send commands.")
 
     async def _send_command(self, packet, totretry):
-        try:
-            if type(packet) is tuple:
-                num = packet[1]
-                pid = packet[0][0]
-                packet = packet[0][1:]
-            else:
-                pid = packet[0]
-                packet = packet[1:]
-                num = -1
-            _LOGGER.info("Pid is %s, Len is %d Rep is %d", pid, len(packet), num)
-            if pid == 'r':
-                extra = len(packet) % 4
-                if extra > 0:
-                    packet = packet + ('=' * (4 - extra))
-                payload = b64decode(packet)
-                add = "b64dec"
-            elif pid == 'h':
-                payload = binascii.unhexlify(packet)
-                add = "unhex"
-            elif pid == "t":
-                await asyncio.sleep(float(packet))
-                return True
-            else:
-                return False
-        except BaseException as ex:
-            _LOGGER.error("Err1: %s ", ex)
-            return False
+        if type(packet) is tuple:
+            num = packet[1]
+            payload = packet[0]
+        else:
+            payload = packet
+            num = -1
+        if isinstance(payload, float):
+            return payload
         if num > 0:
             if num > 100:
                 num = 100
             _LOGGER.info("Changing payload")
-            payload = bytes([payload[0]])+bytes([num])+payload[2:]
-        _LOGGER.info("I am sending %s, Final len is %d", add, len(payload))
-        await self._device.emit_ir(payload, retry=totretry)
+            payload = set_repeat(payload, num)
+        _LOGGER.info("I am sending len %d Rep is %d", len(payload), num)
+        authed = not self._device._force_auth
+        rv = await self._device.emit_ir(payload, retry=totretry)
+        if rv is None and authed and self._device._force_auth:
+            # The device refused the session (e.g. a stale restored one):
+            # pybroadlink authenticates on the next call, send it again
+            _LOGGER.warning("%s: packet refused, sending it again after auth", self._name)
+            rv = await self._device.emit_ir(payload, retry=totretry)
+        self._health.report(rv is not None)
+        if rv is None:
+            # Tell the sequence that the packet did not go through
+            return None
+        if self._sessions is not None:
+            # pybroadlink may have negotiated a new session
+            self._sessions.async_save(self._device)
         return False
 
     def command2payloads(self, command):
         _LOGGER.info("Searching for %s", command)
-        if command in self._commands:
-            _LOGGER.info("%s found in commands", command)
-            return self._commands[command]
-        elif command.startswith('@'):
-            return [command[1:]]
-        else:
-            mo = re.search("^(([a-zA-Z0-9_]*)@)?ch([0-9]+)$", command)
-            pre = '' if not mo or not mo[1] else mo[1]
-            if mo is not None and pre+'ch1' in self._commands:
-                commands = [self._commands[pre + 'ch' + x][0] for x in mo[3]]
-            else:
-                mo = re.search("^([a-zA-Z0-9_]+)#([0-9]+)$", command)
-                if mo is not None:
-                    nm = mo.group(1)
-                    num = int(mo.group(2))
-                    _LOGGER.info("%s rep %d. Searching...", nm, num)
-                    if nm in self._commands:
-                        _LOGGER.info("%s found in commands", nm)
-                        cmdl = self._commands[nm]
-                        return list(zip(cmdl, [num for _ in range(len(cmdl))]))
-                    else:
-                        return []
-                else:
-                    commands = [command]
-            return commands
+        return self._compiler.get(command)
+
+    def command2frame(self, command, hold):
+        """Return the plan of command with its packets joined in one frame.
+
+        The packets of a digit sequence (`ch123`) or of a key made of several
+        codes are played by the RM one after the other, with the gaps they
+        would have if they were sent one by one (hold after each packet, plus
+        the time of the `t` commands in between): the whole sequence costs one
+        emit_ir round trip and its timing does not depend on the network. When
+        the packets cannot be joined (repeated keys, gaps too long for one
+        Broadlink timing, frame too big) the plan is returned as it is.
+        """
+        key = (command, hold)
+        plan = self._frames.get(key)
+        if plan is None:
+            plan = self._join_plan(self.command2payloads(command), hold)
+            if len(self._frames) >= DEFAULT_PLAN_CACHE_SIZE:
+                self._frames.clear()
+            self._frames[key] = plan
+        return plan
+
+    @staticmethod
+    def _join_plan(payloads, hold):
+        lead = []
+        packets = []
+        gaps = []
+        gap = 0.0
+        for i, p in enumerate(payloads):
+            if type(p) is tuple:
+                return payloads
+            elif isinstance(p, float) and not packets:
+                lead.append(p)
+                continue
+            elif not isinstance(p, float):
+                if packets:
+                    gaps.append(gap * 1000000)
+                packets.append(p)
+                gap = 0.0
+            # The wait _async_send_sequence makes after each item of the plan
+            if isinstance(p, float) and p:
+                gap += p
+            elif i < len(payloads) - 1:
+                gap += hold
+        if len(packets) < 2:
+            return payloads
+        try:
+            frame, last_start = join_packets(packets, gaps)
+        except ValueError as ex:
+            _LOGGER.info("Cannot join %d packets: %s", len(packets), ex)
+            return payloads
+        if isinstance(payloads[-1], float):
+            # Trailing pause, measured from the start of the last packet: the
+            # sequence already waits hold after the frame
+            return tuple(lead) + (frame, gap - hold + last_start / 1000000)
+        return tuple(lead) + (frame,)
+
+    @staticmethod
+    def durations(payload):
+        """Return the durations of a frame of the command table or of a learned key."""
+        return decode_packet(payload)
+
+    @staticmethod
+    def decode_raw(command):
+        try:
+            return [decode_command_string(command)]
+        except vol.Invalid as ex:
+            _LOGGER.error("Err1: %s ", ex)
+            return []
 
     async def async_send_command(self, command, **kwargs):
         """Send a command."""
+        if self._coalescer is not None and len(command) == 1 and\
+                kwargs.get(ATTR_NUM_REPEATS, 1) == 1 and not kwargs.get(CONF_SUPERSEDE, False):
+            key, num = split_repeat(command[0])
+            key = self._full_name(key)
+            if key in self._coalescer:
+                await self._coalescer.submit(key, num, partial(self._async_send_merged, kwargs))
+                return
+        await self._async_submit(command, **kwargs)
+
+    async def _async_send_merged(self, kwargs, key, num):
+        """Send num presses of key (a remote@key name) coalesced into one command."""
+        if len(self._main):
+            key = key[len(self.remote) + 1:]
+        return await self._async_submit([key if num == 1 else '%s#%d' % (key, num)], **kwargs)
+
+    async def async_emit(self, command, **kwargs):
+        """Send command without coalescing it.
+
+        Return True if every packet was acknowledged, None if aborted.
+        """
+        return await self._async_submit(command, **kwargs)
+
+    async def _async_submit(self, command, **kwargs):
         num_repeats = kwargs.get(ATTR_NUM_REPEATS, 1)
 
         delay = kwargs.get(ATTR_DELAY_SECS, DEFAULT_DELAY_SECS)
         hold = kwargs.get(ATTR_HOLD_SECS, DEFAULT_HOLD_SECS)
+        single_frame = kwargs.get(CONF_SINGLE_FRAME)
+        if single_frame is None:
+            single_frame = self._single_frame
+        priority = kwargs.get(CONF_PRIORITY)
+        if priority is None:
+            priority = PRIORITY_INTERACTIVE if len(command) == 1 and num_repeats == 1\
+                else PRIORITY_BACKGROUND
+
+        rv = await self._scheduler.submit(
+            self._name,
+            partial(self._async_send_sequence, command, num_repeats, delay, hold,
+                    single_frame),
+            priority=priority,
+            supersede=kwargs.get(CONF_SUPERSEDE, False))
+        if rv is None:
+            _LOGGER.info("%s: %s aborted", self._name, command)
+        return rv
 
+    async def _async_send_sequence(self, command, num_repeats, delay, hold, single_frame):
+        pacer = self._scheduler.pacer()
+        ok = True
         for k in range(num_repeats):
             j = 0
             for c in command:
-                payloads = self.command2payloads(c)
+                if single_frame:
+                    payloads = self.command2frame(c, hold)
+                else:
+                    payloads = self.command2payloads(c)
                 i = 0
                 for local_payload in payloads:
+                    await pacer.wait()
                     pause = await self._send_command(local_payload, 3)
+                    ok = ok and pause is not None
                     i += 1
-                    if i < len(payloads) and not pause:
-                        await asyncio.sleep(hold)
+                    if pause:
+                        pacer.delay(pause)
+                    elif i < len(payloads):
+                        pacer.delay(hold)
                 j += 1
                 if j < len(command) and k < num_repeats - 1:
-                    await asyncio.sleep(delay)
+                    pacer.delay(delay)
+        await pacer.wait()
+        return ok
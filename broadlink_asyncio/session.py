@@ -0,0 +1,101 @@
+"""Persistent Broadlink auth sessions."""
+import binascii
+import logging
+from functools import partial
+
+from homeassistant.core import callback
+from homeassistant.helpers.storage import Store
+
+_LOGGER = logging.getLogger(__name__)
+
+STORAGE_VERSION = 1
+STORAGE_KEY = 'broadlink_asyncio.sessions'
+SAVE_DELAY = 10
+# Errors of a device refusing the session: auth failed, control key expired
+SESSION_ERRORS = (0xffff, 0xfff9)
+
+
+async def async_get_sessions(hass):
+    """Return the session store, loading it the first time."""
+    if __name__ not in hass.data:
+        sessions = SessionStore(hass)
+        hass.data[__name__] = sessions
+        await sessions.async_load()
+    return hass.data[__name__]
+
+
+def has_session(device):
+    """Tell whether device has a session (e.g. a restored one) not known to be refused."""
+    return device._key != device.KEY and not device._force_auth
+
+
+async def async_check_session(device, timeout=-1):
+    """Return True if device accepts its session, False if not, None if it does not answer.
+
+    The device is asked its firmware version, a one packet request that
+    needs a session: any answer but an auth error tells that the session is
+    valid, without negotiating a new one.
+    """
+    from pybroadlink.const import CD_RETURN_IMMEDIATELY, CD_CONTINUE_WAITING
+
+    def check(data, addr):
+        if len(data) > 0x23:
+            return CD_RETURN_IMMEDIATELY, data[0x22] | (data[0x23] << 8)
+        return CD_CONTINUE_WAITING
+    rv = await device._protocol(partial(device._decorate_packet, 0x6a, bytearray([0x68])),
+                                check, timeout, 1)
+    if not rv:
+        return None
+    return rv[0] not in SESSION_ERRORS
+
+
+class SessionStore(object):
+    """Auth sessions (id and key) negotiated with the devices, by MAC.
+
+    A restored session lets the first command go without an auth round trip.
+    It may be stale (e.g. the device rebooted): the device then refuses the
+    packet, and the entity sends it again after pybroadlink authenticated,
+    saving the new session. The health probe checks a restored session with
+    async_check_session instead of authenticating again, so that the devices
+    do not all negotiate a new session at startup. pybroadlink has no API
+    for the session, hence the private fields.
+    """
+
+    def __init__(self, hass):
+        self._store = Store(hass, STORAGE_VERSION, STORAGE_KEY)
+        self._sessions = dict()
+
+    async def async_load(self):
+        data = await self._store.async_load()
+        if data:
+            self._sessions = data.get('sessions', dict())
+        _LOGGER.info("Loaded %d sessions", len(self._sessions))
+
+    async def async_restore(self, device):
+        """Give device its saved session; return True if there was one."""
+        session = self._sessions.get(binascii.hexlify(device._mac).decode('utf8'))
+        if not session:
+            return False
+        # Opening the endpoint resets the session: open it first
+        if not await device._init_remote(False):
+            return False
+        device._id = binascii.unhexlify(session['id'])
+        device._key = binascii.unhexlify(session['key'])
+        device._force_auth = False
+        return True
+
+    @callback
+    def async_save(self, device):
+        """Save the session of device if it changed."""
+        if device._key == device.KEY:
+            return
+        session = dict(id=binascii.hexlify(device._id).decode('utf8'),
+                       key=binascii.hexlify(device._key).decode('utf8'))
+        mac = binascii.hexlify(device._mac).decode('utf8')
+        if self._sessions.get(mac) != session:
+            self._sessions[mac] = session
+            self._store.async_delay_save(self._data_to_save, SAVE_DELAY)
+
+    @callback
+    def _data_to_save(self):
+        return dict(sessions=self._sessions)
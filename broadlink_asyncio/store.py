@@ -0,0 +1,82 @@
+# Copied into broadlink_asyncio, gocomma and orvibo_asyncio: keep the
+# copies identical (see check_shared.py at the top of the repository).
+"""Persistent store of the codes learned by the IR remote platforms."""
+import logging
+
+from homeassistant.core import callback
+from homeassistant.helpers.storage import Store
+
+_LOGGER = logging.getLogger(__name__)
+
+STORAGE_VERSION = 1
+SAVE_DELAY = 10
+
+
+class LearnedStore(object):
+    """Codes learned by one device, indexed by remote and key.
+
+    The command strings (`r` or `h` prefixed, as in the configuration) are
+    saved in the Home Assistant storage folder. In memory each key holds the
+    tuple returned by the decode function, ready to be merged into the command
+    tables of the entities: nothing is decoded when a command is sent. Saves
+    are delayed so that a learning session writes the file once.
+    """
+
+    def __init__(self, hass, key, decode):
+        self._store = Store(hass, STORAGE_VERSION, key)
+        self._decode = decode
+        self._codes = dict()
+        self._remotes = dict()
+        self._listeners = []
+
+    def __len__(self):
+        return sum(len(keys) for keys in self._remotes.values())
+
+    @property
+    def remotes(self):
+        """Return the decoded codes as a dict remote -> key -> tuple."""
+        return self._remotes
+
+    def add_listener(self, listener):
+        """Call listener() each time codes are added."""
+        self._listeners.append(listener)
+
+    async def async_load(self):
+        data = await self._store.async_load()
+        if data:
+            for remnm, keys in data.get('remotes', dict()).items():
+                for keynm, codes in keys.items():
+                    self._set(remnm, keynm, codes)
+        _LOGGER.info("Loaded %d learned keys", len(self))
+
+    @callback
+    def async_add(self, remote, key, codes):
+        """Store the command strings learned for remote@key."""
+        return not self.async_add_keys(remote, {key: codes})
+
+    @callback
+    def async_add_keys(self, remote, keys):
+        """Store the command strings of a dict key -> codes of remote.
+
+        Listeners are called once for all the keys. Return the keys that have
+        no valid code.
+        """
+        failed = [key for key, codes in keys.items() if not self._set(remote, key, codes)]
+        if len(failed) < len(keys):
+            self._store.async_delay_save(self._data_to_save, SAVE_DELAY)
+            for listener in self._listeners:
+                listener()
+        return failed
+
+    def _set(self, remote, key, codes):
+        decoded = tuple(p for c in codes for p in self._decode(c))
+        if not decoded:
+            _LOGGER.error("No valid code for %s@%s", remote, key)
+            return False
+        self._codes.setdefault(remote, dict())[key] = list(codes)
+        self._remotes.setdefault(remote, dict())[key] = decoded
+        return True
+
+    @callback
+    def _data_to_save(self):
+        return dict(remotes=self._codes)
@@ -0,0 +1,32 @@
+"""Check that the modules shared by the IR remote platforms are identical.
+
+Home Assistant custom components cannot import each other, so the modules
+below are copied into each platform: edit one copy, copy it over the others
+and run this script (it exits with 1 when a copy differs).
+"""
+import os
+import sys
+from hashlib import md5
+
+PLATFORMS = ('broadlink_asyncio', 'gocomma', 'orvibo_asyncio')
+SHARED = ('coalescer.py', 'commands.py', 'fanout.py', 'fingerprint.py',
+          'health.py', 'learning.py', 'scheduler.py', 'store.py')
+
+
+def main():
+    root = os.path.dirname(os.path.abspath(__file__))
+    rv = 0
+    for name in SHARED:
+        digests = dict()
+        for platform in PLATFORMS:
+            with open(os.path.join(root, platform, name), 'rb') as f:
+                digests[platform] = md5(f.read()).hexdigest()
+        if len(set(digests.values())) > 1:
+            rv = 1
+            print("%s differs: %s" % (name, ", ".join(
+                "%s %s" % (p, d) for p, d in digests.items())))
+    return rv
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1 @@
+"""gocomma remote component"""
@@ -0,0 +1,105 @@
+# Copied into broadlink_asyncio, gocomma and orvibo_asyncio: keep the
+# copies identical (see check_shared.py at the top of the repository).
+"""Coalescing of rapid-fire relative keys used by the IR remote platforms."""
+import asyncio
+import logging
+
+import voluptuous as vol
+import homeassistant.helpers.config_validation as cv
+
+from .commands import REPEAT_RE
+
+_LOGGER = logging.getLogger(__name__)
+
+CONF_KEYS = 'keys'
+CONF_WINDOW = 'window'
+DEFAULT_WINDOW = 0.3
+
+
+def same_remote(keys):
+    """Check that the keys of a group are `remote@key` names of the same remote."""
+    remotes = set(k.partition('@')[0] for k in keys)
+    if any('@' not in k for k in keys) or len(remotes) != 1:
+        raise vol.Invalid('keys of a group must be remote@key names of the same remote')
+    return keys
+
+
+COALESCE_SCHEMA = vol.All(cv.ensure_list, [vol.Schema({
+    vol.Required(CONF_KEYS): vol.All(cv.ensure_list, [cv.string],
+                                     vol.Length(min=1, max=2), same_remote),
+    vol.Optional(CONF_WINDOW, default=DEFAULT_WINDOW): vol.All(
+        vol.Coerce(float), vol.Range(min=0)),
+})])
+
+
+def split_repeat(command):
+    """Return the key and the number of presses of a `key` or `key#N` command string."""
+    mo = REPEAT_RE.match(command)
+    if mo is None:
+        return command, 1
+    return mo.group(1), int(mo.group(2))
+
+
+class Coalescer(object):
+    """Merge the presses of a key arriving within a short window.
+
+    Each group has a key and optionally its opposite (e.g. volume up and
+    volume down). The first press of a key of a group opens the window of
+    the group: the presses of the group arriving until it closes are added
+    up, the ones of the opposite key counting as negative, and when it
+    closes the net count is sent at once, as a single `key#N` command, by
+    the emit function of the first press. Presses that cancel out send
+    nothing. All the callers get the result of the merged emission.
+    """
+
+    def __init__(self, groups):
+        self._keys = dict()
+        for group in groups:
+            keys = tuple(group[CONF_KEYS])
+            for sign, key in zip((1, -1), keys):
+                self._keys[key] = (keys, sign, group[CONF_WINDOW])
+        self._pending = dict()
+        self.presses = 0
+        self.emissions = 0
+
+    def __contains__(self, key):
+        return key in self._keys
+
+    @property
+    def metrics(self):
+        return dict(presses=self.presses, emissions=self.emissions)
+
+    async def submit(self, key, num, emit):
+        """Add num presses of key; emit(key, num) sends the merged ones."""
+        keys, sign, window = self._keys[key]
+        self.presses += num
+        pending = self._pending.get(keys)
+        if pending is None:
+            loop = asyncio.get_event_loop()
+            pending = dict(net=0, emit=emit, future=loop.create_future())
+            self._pending[keys] = pending
+            loop.call_later(window, self._close, keys)
+        pending['net'] += sign * num
+        return await asyncio.shield(pending['future'])
+
+    def _close(self, keys):
+        pending = self._pending.pop(keys)
+        asyncio.get_event_loop().create_task(self._emit(keys, pending))
+
+    async def _emit(self, keys, pending):
+        net = pending['net']
+        future = pending['future']
+        try:
+            if net == 0:
+                _LOGGER.debug("Presses of %s cancel out", '/'.join(keys))
+                rv = True
+            else:
+                self.emissions += 1
+                rv = await pending['emit'](keys[0] if net > 0 else keys[1], abs(net))
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as ex:
+            future.set_exception(ex)
+        else:
+            future.set_result(rv)
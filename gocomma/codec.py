@@ -0,0 +1,30 @@
+"""Gocomma R9 IR code helpers."""
+import struct
+
+REPEAT_GAP = 40000
+MAX_REPEAT_SIZE = 1024
+
+
+def repeat_payload(payload, num, gap=REPEAT_GAP, maxsize=MAX_REPEAT_SIZE):
+    """Return the list of (payload, count) emitting payload num times.
+
+    The R9 plays the timings it receives (little endian unsigned shorts, in
+    microseconds) as they are: count copies of the code, each one followed
+    by a space of at least gap microseconds, are joined in one payload of at
+    most maxsize bytes, so that a key repeated N times costs a few emit_ir
+    instead of N.
+    """
+    if num <= 1 or len(payload) < 2 or len(payload) % 2:
+        return [(payload, 1)] * max(num, 1)
+    if (len(payload) // 2) % 2:
+        unit = payload + struct.pack('<H', gap)
+    else:
+        last = struct.unpack_from('<H', payload, len(payload) - 2)[0]
+        unit = payload[:-2] + struct.pack('<H', max(last, gap))
+    per = max((maxsize - len(payload)) // len(unit) + 1, 1)
+    rv = []
+    while num > 0:
+        count = min(per, num)
+        rv.append((unit * (count - 1) + payload, count))
+        num -= count
+    return rv
@@ -0,0 +1,149 @@
+"""Passive discovery of the Tuya devices (Gocomma R9) announcing themselves on the LAN."""
+import asyncio
+import json
+import logging
+import socket
+from hashlib import md5
+
+_LOGGER = logging.getLogger(__name__)
+
+PORT_CLEAR = 6666
+PORT_ENCRYPTED = 6667
+ANNOUNCE_INTERVAL = 6
+DEVICE_TTL = 300
+BROADCAST_KEY = md5(b'yGAdlopoPVldABfn').digest()
+
+
+def get_discovery(hassdata):
+    """Return the listener shared by the entities, starting it the first time."""
+    if __name__ not in hassdata:
+        hassdata[__name__] = TuyaDiscovery()
+        asyncio.get_event_loop().create_task(hassdata[__name__].async_start())
+    return hassdata[__name__]
+
+
+def parse_announcement(data, encrypted):
+    """Return the dict announced in a broadcast packet or None."""
+    if len(data) < 28 or data[0:4] != b'\x00\x00\x55\xAA' or data[-4:] != b'\x00\x00\xAA\x55':
+        return None
+    payload = data[20:-8]
+    if encrypted:
+        from Crypto.Cipher import AES
+        try:
+            payload = AES.new(BROADCAST_KEY, AES.MODE_ECB).decrypt(payload)
+            payload = payload[:-payload[-1]]
+        except (ValueError, IndexError):
+            return None
+    try:
+        info = json.loads(payload.decode('utf8'))
+    except ValueError:
+        return None
+    if not isinstance(info, dict) or 'gwId' not in info:
+        return None
+    return info
+
+
+class AnnouncementProtocol(asyncio.DatagramProtocol):
+
+    def __init__(self, discovery, encrypted):
+        self._discovery = discovery
+        self._encrypted = encrypted
+
+    def datagram_received(self, data, addr):
+        self._discovery.feed(data, addr, self._encrypted)
+
+    def error_received(self, exc):
+        _LOGGER.warning("Error receiving announcement: %s", exc)
+
+
+class TuyaDiscovery(object):
+    """Keep the id -> IP map of the Tuya devices from their UDP announcements.
+
+    The devices broadcast their id and IP every few seconds on port 6666
+    (protocol 3.1, clear text) or 6667 (3.3, encrypted with a well known
+    key): both ports are listened to, with address reuse so that other
+    Tuya integrations can listen as well. A packet identical to the last
+    one received from the same address only refreshes the device, without
+    being decoded again. listener(ip) is called when the device with the
+    given id is first heard and when it shows up at a new IP. Devices not heard for DEVICE_TTL seconds
+    are dropped.
+    """
+
+    def __init__(self):
+        self._devices = dict()
+        self._last_packet = dict()
+        self._listeners = dict()
+        self._transports = []
+        self.started = None
+
+    def __len__(self):
+        return len(self._devices)
+
+    async def async_start(self):
+        loop = asyncio.get_event_loop()
+        self.started = loop.time()
+        for port, encrypted in ((PORT_CLEAR, False), (PORT_ENCRYPTED, True)):
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            try:
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+                if hasattr(socket, 'SO_REUSEPORT'):
+                    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+                sock.bind(('', port))
+                transport, _ = await loop.create_datagram_endpoint(
+                    lambda: AnnouncementProtocol(self, encrypted), sock=sock)
+                self._transports.append(transport)
+            except OSError as ex:
+                sock.close()
+                _LOGGER.error("Cannot listen on port %d: %s", port, ex)
+
+    def stop(self):
+        for transport in self._transports:
+            transport.close()
+        self._transports = []
+
+    def add_listener(self, idv, listener):
+        """Call listener(ip) when idv is heard first or changes IP; return a remove function."""
+        self._listeners.setdefault(idv, []).append(listener)
+
+        def remove_listener():
+            self._listeners[idv].remove(listener)
+            if not self._listeners[idv]:
+                del self._listeners[idv]
+        return remove_listener
+
+    def feed(self, data, addr, encrypted):
+        now = asyncio.get_event_loop().time()
+        last = self._last_packet.get(addr[0])
+        if last is not None and last[0] == data and last[1] in self._devices:
+            self._devices[last[1]] = (self._devices[last[1]][0], now)
+            return
+        info = parse_announcement(data, encrypted)
+        if info is None:
+            return
+        idv = info['gwId']
+        info.setdefault('ip', addr[0])
+        self._last_packet[addr[0]] = (data, idv)
+        old = self._devices.get(idv)
+        self._devices[idv] = (info, now)
+        if old is None:
+            # The device may have moved while nobody was listening
+            _LOGGER.info("Discovered device %s at %s", idv, info['ip'])
+        elif old[0]['ip'] != info['ip']:
+            _LOGGER.warning("Device %s moved from %s to %s", idv, old[0]['ip'], info['ip'])
+        else:
+            return
+        for listener in list(self._listeners.get(idv, ())):
+            listener(info['ip'])
+
+    def devices(self):
+        """Return the dict id -> announced info of the devices heard lately."""
+        now = asyncio.get_event_loop().time()
+        for idv, (_, seen) in list(self._devices.items()):
+            if now - seen > DEVICE_TTL:
+                del self._devices[idv]
+        return dict((idv, info) for idv, (info, _) in self._devices.items())
+
+    def address(self, idv):
+        """Return the last IP of idv or None."""
+        info = self.devices().get(idv)
+        return None if info is None else info['ip']
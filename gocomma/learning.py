@@ -0,0 +1,108 @@
+# Copied into broadlink_asyncio, gocomma and orvibo_asyncio: keep the
+# copies identical (see check_shared.py at the top of the repository).
+"""Learning sessions used by the IR remote platforms."""
+import logging
+from base64 import b64encode
+from collections import OrderedDict
+
+_LOGGER = logging.getLogger(__name__)
+
+LEARN_ATTEMPTS = 2
+GUESS_MIN_SCORE = 0.5
+
+
+class LearningSession(object):
+    """Learn a list of keys in a row, entering learning mode once.
+
+    Devices leaving learning mode after each capture (rearm=True) are put
+    back in learning mode right after it, with no fixed wait. A capture that
+    is empty, or that is a near-duplicate of the code of another key of the
+    same remote, is retried in place up to attempts times before moving to
+    the next key. The keys learned are saved through the entity (see
+    save_learned_key), which lists the keys of the last session only (see
+    clear_learned); for each of them the session also records the remote
+    whose codes look the most like it, when it is not the one learned for.
+    """
+
+    def __init__(self, entity, timeout, remote, rearm=False, attempts=LEARN_ATTEMPTS):
+        self._entity = entity
+        self._timeout = timeout
+        self._remote = remote
+        self._rearm = rearm
+        self._attempts = attempts
+        self._armed = False
+        self.learned = OrderedDict()
+        self.duplicates = OrderedDict()
+        self.missed = []
+        self.guesses = dict()
+        self.exited = False
+
+    async def run(self, keynames, prompt, enter=True):
+        """Learn keynames calling prompt(keyname, index, total) before each capture.
+
+        Return False if the device could not enter learning mode. Set enter
+        to False if the device is already in learning mode.
+        """
+        self._armed = not enter
+        self._entity.clear_learned()
+        try:
+            if not self._armed and not await self._arm():
+                return False
+            for xx, keyname in enumerate(keynames):
+                if not await self._learn(keyname, xx, len(keynames), prompt):
+                    self.missed.append(keyname)
+        finally:
+            self.exited = await self._entity.exit_learning_mode()
+        return True
+
+    def notification(self):
+        """Return the text listing the learned, duplicate and missed keys."""
+        allnot = ''
+        for keyname, packet in self.learned.items():
+            allnot += '{}:\n    - "r{}"\n'.format(keyname, b64encode(packet).decode('utf8'))
+            if keyname in self.guesses:
+                allnot += '# looks like a key of {}\n'.format(self.guesses[keyname])
+            allnot += '\n'
+        for keyname, other in self.duplicates.items():
+            if keyname not in self.learned:
+                allnot += '{}: same code as {}\n\n'.format(keyname, other)
+        for keyname in self.missed:
+            if keyname not in self.duplicates:
+                allnot += '{}: not received\n\n'.format(keyname)
+        return allnot
+
+    async def _arm(self):
+        self._armed = await self._entity.enter_learning_mode()
+        return self._armed
+
+    async def _learn(self, keyname, xx, numkeys, prompt):
+        for _ in range(self._attempts):
+            if not self._armed and not await self._arm():
+                _LOGGER.error("Failed entering learning mode for %s", keyname)
+                return False
+            prompt(keyname, xx, numkeys)
+            packet = await self._entity.get_learned_key(self._timeout, keyname)
+            if self._rearm:
+                self._armed = False
+            if not packet:
+                _LOGGER.warning("Did not receive key %s", keyname)
+                continue
+            other = self._owner(packet, keyname)
+            if other is not None:
+                _LOGGER.warning("Key %s has the same code as %s", keyname, other)
+                self.duplicates[keyname] = other
+                continue
+            remote, score = self._entity.closest_remote(packet)
+            if remote is not None and remote != self._remote and score >= GUESS_MIN_SCORE:
+                self.guesses[keyname] = remote
+            self._entity.save_learned_key(keyname, packet, self._remote)
+            self.learned[keyname] = packet
+            return True
+        return False
+
+    def _owner(self, packet, keyname):
+        for name in self._entity.similar_keys(packet):
+            remote, _, other = name.partition('@')
+            if remote == self._remote and other != keyname:
+                return other
+        return None
@@ -0,0 +1,200 @@
+"""Persistent connection with the Gocomma R9 (Tuya) devices."""
+import asyncio
+import logging
+
+_LOGGER = logging.getLogger(__name__)
+
+HEARTBEAT_INTERVAL = 10
+RECONNECT_MIN_INTERVAL = 1
+RECONNECT_MAX_INTERVAL = 60
+
+
+def get_session(hassdata, host, factory):
+    """Return the session of host, creating it with factory if needed."""
+    sessions = hassdata.setdefault(__name__, dict())
+    if host not in sessions:
+        sessions[host] = factory()
+    return sessions[host]
+
+
+class TuyaSession(object):
+    """Keep one TCP connection with an R9 open, shared by all its entities.
+
+    pygocomma drops the connection after force_reconnect_s seconds without
+    traffic and opens a new one for the next call: the session disables
+    that and keeps the connection alive instead, pinging the device when it
+    has been idle for heartbeat seconds. When the connection is lost it is
+    opened again in the background (waiting RECONNECT_MIN_INTERVAL seconds,
+    doubling up to RECONNECT_MAX_INTERVAL at each failure), so that commands
+    find it ready. The calls to the device are serialized, and the heartbeat
+    never runs while a call is in progress or while the session is paused
+    (e.g. while the device is learning). listener(ok) is called with the
+    outcome of each heartbeat.
+    """
+
+    def __init__(self, name, device, heartbeat=HEARTBEAT_INTERVAL):
+        self._name = name
+        self._device = device
+        device._force_reconnect_s = 0
+        self._heartbeat = heartbeat
+        self._lock = asyncio.Lock()
+        self._paused = False
+        self._last_traffic = None
+        self._connected_since = None
+        self._failures = 0
+        self._listeners = []
+        self._task = None
+        self._wakeup = None
+        self._connections = 0
+        self.heartbeats = 0
+
+    @property
+    def device(self):
+        """Return the pygocomma R9 object."""
+        return self._device
+
+    @property
+    def connected(self):
+        return self._device._writer is not None
+
+    @property
+    def reconnects(self):
+        return max(self._connections - 1, 0)
+
+    @property
+    def uptime(self):
+        """Return the seconds since the connection was opened (None if closed)."""
+        if self._connected_since is None:
+            return None
+        return asyncio.get_event_loop().time() - self._connected_since
+
+    @property
+    def metrics(self):
+        uptime = self.uptime
+        return dict(connected=uptime is not None,
+                    uptime=0 if uptime is None else int(uptime),
+                    reconnects=self.reconnects, heartbeats=self.heartbeats)
+
+    def add_listener(self, listener):
+        """Call listener(ok) after each heartbeat; return a remove function."""
+        self._listeners.append(listener)
+        if self._task is None:
+            self._task = asyncio.get_event_loop().create_task(self._loop())
+
+        def remove_listener():
+            self._listeners.remove(listener)
+            if not self._listeners and self._task is not None:
+                self._task.cancel()
+                self._task = None
+        return remove_listener
+
+    def move(self, host):
+        """Point the device to host, opening the connection again there."""
+        if host != self._device._hp[0]:
+            asyncio.get_event_loop().create_task(self._async_move(host))
+
+    async def _async_move(self, host):
+        async with self._lock:
+            _LOGGER.info("%s: moving to %s", self._name, host)
+            await self._device.destroy_connection()
+            self._device._hp = (host, self._device._hp[1])
+            self._connected_since = None
+        self._failures = 0
+        self._wake()
+
+    def pause(self):
+        """Stop the heartbeat (e.g. while the device is learning)."""
+        self._paused = True
+
+    def resume(self):
+        self._paused = False
+
+    async def emit_ir(self, *args, **kwargs):
+        return await self._call(self._device.emit_ir, *args, **kwargs)
+
+    async def ask_last(self, *args, **kwargs):
+        return await self._call(self._device.ask_last, *args, **kwargs)
+
+    async def enter_learning_mode(self, *args, **kwargs):
+        return await self._call(self._device.enter_learning_mode, *args, **kwargs)
+
+    async def exit_learning_mode(self, *args, **kwargs):
+        return await self._call(self._device.exit_learning_mode, *args, **kwargs)
+
+    async def get_learned_key(self, *args, **kwargs):
+        return await self._call(self._device.get_learned_key, *args, **kwargs)
+
+    async def _call(self, method, *args, **kwargs):
+        async with self._lock:
+            rv = await method(*args, **kwargs)
+            self._check_connection(rv is not None)
+        return rv
+
+    def _check_connection(self, ok):
+        loop = asyncio.get_event_loop()
+        if ok:
+            self._last_traffic = loop.time()
+        if self.connected:
+            if self._connected_since is None:
+                self._opened()
+        elif self._connected_since is not None:
+            _LOGGER.warning("%s: connection lost after %ds", self._name,
+                            loop.time() - self._connected_since)
+            self._connected_since = None
+            self._wake()
+
+    def _opened(self):
+        loop = asyncio.get_event_loop()
+        self._connections += 1
+        self._connected_since = self._last_traffic = loop.time()
+        self._failures = 0
+        _LOGGER.info("%s: connected to %s:%d", self._name, *self._device._hp)
+
+    async def _connect(self):
+        async with self._lock:
+            if self.connected:
+                return True
+            try:
+                ok = await asyncio.wait_for(self._device._init_connection(), self._device._timeout)
+            except asyncio.TimeoutError:
+                await self._device.destroy_connection()
+                ok = False
+            if ok:
+                self._opened()
+            return ok
+
+    async def _ping(self):
+        async with self._lock:
+            rv = await self._device.ping(retry=1)
+            self._check_connection(rv is not None)
+        self.heartbeats += 1
+        for listener in list(self._listeners):
+            listener(rv is not None)
+
+    def _wake(self):
+        if self._wakeup is not None and not self._wakeup.done():
+            self._wakeup.set_result(True)
+
+    async def _loop(self):
+        loop = asyncio.get_event_loop()
+        while True:
+            if self._paused or self._lock.locked():
+                delay = self._heartbeat
+            elif not self.connected:
+                if await self._connect():
+                    delay = self._heartbeat
+                else:
+                    self._failures += 1
+                    delay = min(RECONNECT_MIN_INTERVAL * 2 ** (self._failures - 1),
+                                RECONNECT_MAX_INTERVAL)
+                    _LOGGER.debug("%s: cannot connect, retrying in %ds", self._name, delay)
+            else:
+                delay = self._heartbeat - (loop.time() - self._last_traffic)
+                if delay <= 0:
+                    await self._ping()
+                    delay = self._heartbeat if self.connected else 0
+            self._wakeup = loop.create_future()
+            try:
+                await asyncio.wait([self._wakeup], timeout=delay)
+            finally:
+                self._wakeup = None
@@ -11,8 +11,25 @@ def get_orvibo_class(hassdata, classname):
         from asyncio_orvibo.allone import AllOne
         from asyncio_orvibo.s20 import S20
         from asyncio_orvibo.orvibo_udp import PORT
+        from .discovery import OrviboDiscovery
+        from .mux import OrviboMux
         import logging
         _LOGGER = logging.getLogger(__name__)
         _LOGGER.info("Initializing orvibo_asyncio classes")
-        hassdata[ORVIBO_ASYNCIO_DATA_KEY] = dict(AllOne=AllOne, S20=S20, PORT=PORT)
+        # One UDP endpoint for all the devices, demultiplexed by the mux
+        mux = OrviboMux()
+        mux.install()
+        discovery = OrviboDiscovery(mux, dict(AllOne=AllOne, S20=S20))
+        hassdata[ORVIBO_ASYNCIO_DATA_KEY] = dict(AllOne=AllOne, S20=S20, PORT=PORT, mux=mux,
+                                                 discovery=discovery)
     return hassdata[ORVIBO_ASYNCIO_DATA_KEY][classname]
+
+
+def get_orvibo_mux(hassdata):
+    """Return the OrviboMux owning the UDP endpoint of the devices."""
+    return get_orvibo_class(hassdata, 'mux')
+
+
+def get_orvibo_discovery(hassdata):
+    """Return the OrviboDiscovery cache shared by the platforms."""
+    return get_orvibo_class(hassdata, 'discovery')
@@ -0,0 +1,94 @@
+"""Discovery of the Orvibo devices shared by the switch and remote platforms."""
+import asyncio
+import logging
+import struct
+
+from asyncio_orvibo.orvibo_udp import OrviboUDP, DISCOVERY_ALLONE, DISCOVERY_S20
+
+_LOGGER = logging.getLogger(__name__)
+
+DEVICE_TTL = 900
+BROADCAST_REUSE = 60
+DISCOVERY_ID = b'\x71\x61'
+DISCOVERY_MIN_LEN = 41
+DEVICE_TYPES = dict(AllOne=DISCOVERY_ALLONE, S20=DISCOVERY_S20)
+
+
+def parse_discovery_packet(data, addr):
+    """Return the device dict of a discovery reply (as the library does) or None."""
+    if len(data) < DISCOVERY_MIN_LEN or data[4:6] != DISCOVERY_ID:
+        return None
+    for tp in DEVICE_TYPES.values():
+        if data.find(tp) >= 0:
+            return dict(hp=addr, type=tp, mac=data[7:13],
+                        mytime=struct.unpack('<I', data[37:41])[0], raw=data)
+    return None
+
+
+class OrviboDiscovery(object):
+    """Cache of the Orvibo devices found on the network, keyed by MAC.
+
+    One broadcast finds both the S20 and the AllOne devices: a broadcast is
+    not repeated for BROADCAST_REUSE seconds and concurrent requests for
+    the same broadcast address share the running one, so that the discovery
+    services of the two platforms cost one broadcast. Discovery replies
+    received at any time (e.g. answers to another client) are added to the
+    cache as well. Devices not seen for DEVICE_TTL seconds are dropped.
+    """
+
+    def __init__(self, mux, classes):
+        self._classes = classes
+        self._devices = dict()
+        self._last_broadcast = dict()
+        self._running = dict()
+        mux.add_listener(None, self._async_datagram)
+
+    def __len__(self):
+        return len(self._devices)
+
+    def _async_datagram(self, data, addr):
+        dev = parse_discovery_packet(data, addr)
+        if dev is not None:
+            self._add(dev)
+
+    def _add(self, dev):
+        if dev['mac'] not in self._devices:
+            _LOGGER.info("Discovered device %s at %s", OrviboUDP.print_mac(dev['mac']), dev['hp'][0])
+        self._devices[dev['mac']] = (dev, asyncio.get_event_loop().time())
+
+    async def async_discover(self, broadcast_address, timeout):
+        """Broadcast a discovery unless one was made lately."""
+        loop = asyncio.get_event_loop()
+        last = self._last_broadcast.get(broadcast_address)
+        if last is not None and loop.time() - last < BROADCAST_REUSE:
+            return
+        task = self._running.get(broadcast_address)
+        if task is None:
+            task = loop.create_task(self._broadcast(broadcast_address, timeout))
+            self._running[broadcast_address] = task
+        await asyncio.shield(task)
+
+    async def _broadcast(self, broadcast_address, timeout):
+        try:
+            hosts = await OrviboUDP.discovery(broadcast_address, timeout)
+            for dev in hosts.values():
+                self._add(dev)
+            self._last_broadcast[broadcast_address] = asyncio.get_event_loop().time()
+        finally:
+            del self._running[broadcast_address]
+
+    def devices(self, classname):
+        """Return a dict 'ip:port' -> new device object of the cached devices of a class."""
+        now = asyncio.get_event_loop().time()
+        cls = self._classes[classname]
+        tp = DEVICE_TYPES[classname]
+        rv = dict()
+        for mac, (dev, seen) in list(self._devices.items()):
+            if now - seen > DEVICE_TTL:
+                del self._devices[mac]
+            elif dev['type'] == tp:
+                obj = cls(**dev)
+                if tp == DISCOVERY_S20:
+                    obj.state = 0 if dev['raw'][-1:] == b'\x00' else 1
+                rv['%s:%d' % dev['hp']] = obj
+        return rv
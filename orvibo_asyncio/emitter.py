@@ -0,0 +1,67 @@
+"""Acknowledged emission of IR packets used by the Orvibo AllOne platform."""
+import asyncio
+import logging
+
+_LOGGER = logging.getLogger(__name__)
+
+DEFAULT_ACK_TIMEOUT = 1
+DEFAULT_ATTEMPTS = 2
+
+
+class SerialEmitter(object):
+    """Send IR packets one at a time, acknowledged in the background.
+
+    The AllOne acknowledgements carry nothing identifying the packet they
+    answer (any emit reply from the MAC is accepted), so acks cannot be
+    matched to packets and at most one packet is in flight: send() returns
+    as soon as the packet is out, and the next send() first waits for the
+    previous packet to be acknowledged, meanwhile the caller paces the next
+    one. A packet left without acknowledgement for ack_timeout seconds is
+    sent again (up to attempts times) before any following packet, so that
+    the order of the emissions is kept. report(ok) is called with the
+    outcome of each packet.
+    """
+
+    def __init__(self, emit, name, report,
+                 ack_timeout=DEFAULT_ACK_TIMEOUT, attempts=DEFAULT_ATTEMPTS):
+        self._emit = emit
+        self._name = name
+        self._report = report
+        self._ack_timeout = ack_timeout
+        self._attempts = attempts
+        self._inflight = None
+        self.sent = 0
+        self.acked = 0
+        self.lost = 0
+        self.retransmitted = 0
+
+    async def send(self, payload):
+        await self.drain()
+        self.sent += 1
+        self._inflight = asyncio.get_event_loop().create_task(self._emission(payload))
+
+    async def drain(self):
+        """Wait for the acknowledgement of the packet in flight."""
+        if self._inflight is not None:
+            task = self._inflight
+            self._inflight = None
+            ok = await task
+            if ok:
+                self.acked += 1
+            else:
+                self.lost += 1
+            self._report(ok)
+
+    def cancel(self):
+        if self._inflight is not None:
+            self._inflight.cancel()
+            self._inflight = None
+
+    async def _emission(self, payload):
+        for attempt in range(self._attempts):
+            if attempt:
+                self.retransmitted += 1
+                _LOGGER.warning("%s: no ack, sending the packet again", self._name)
+            if await self._emit(payload, timeout=self._ack_timeout, retry=1) is not None:
+                return True
+        return False
@@ -0,0 +1,99 @@
+# Copied into broadlink_asyncio, gocomma and orvibo_asyncio: keep the
+# copies identical (see check_shared.py at the top of the repository).
+"""Fan-out of a command to IR remotes of any of the IR remote platforms."""
+import asyncio
+import logging
+from functools import partial
+
+import voluptuous as vol
+import homeassistant.helpers.config_validation as cv
+from homeassistant.components.remote import (
+    DOMAIN, ATTR_NUM_REPEATS, ATTR_DELAY_SECS, ATTR_COMMAND, ATTR_HOLD_SECS,
+    DEFAULT_DELAY_SECS, DEFAULT_HOLD_SECS, DEFAULT_NUM_REPEATS)
+from homeassistant.const import ATTR_ENTITY_ID
+
+from .scheduler import PRIORITIES
+
+_LOGGER = logging.getLogger(__name__)
+
+CONF_PRIORITY = 'priority'
+SERVICE_FANOUT = 'ir_fanout_send'
+EVENT_FANOUT_RESULT = 'ir_fanout_send_result'
+# Where each IR remote platform keeps its entities
+IR_DATA_KEYS = ('remote.broadlink_asyncio', 'remote.gocomma', 'remote.orvibo_asyncio')
+
+FANOUT_COMMAND_SCHEMA = vol.Schema({
+    vol.Required(ATTR_ENTITY_ID): cv.entity_ids,
+    vol.Required(ATTR_COMMAND): vol.All(cv.ensure_list, [cv.string]),
+    vol.Optional(ATTR_NUM_REPEATS, default=DEFAULT_NUM_REPEATS): cv.positive_int,
+    vol.Optional(ATTR_DELAY_SECS, default=DEFAULT_DELAY_SECS): vol.Coerce(float),
+    vol.Optional(ATTR_HOLD_SECS, default=DEFAULT_HOLD_SECS): vol.Coerce(float),
+    vol.Optional(CONF_PRIORITY): vol.In(PRIORITIES),
+})
+
+
+def async_register_fanout(hass):
+    """Register the fan-out service unless another IR platform did it."""
+    if not hass.services.has_service(DOMAIN, SERVICE_FANOUT):
+        hass.services.async_register(DOMAIN, SERVICE_FANOUT, partial(
+            async_fanout_service_handler, hass), schema=FANOUT_COMMAND_SCHEMA)
+
+
+def ir_entities(hass):
+    """Return the dict entity_id -> entity of the IR remotes of all the platforms."""
+    rv = dict()
+    for key in IR_DATA_KEYS:
+        for entity in hass.data.get(key, dict()).values():
+            if getattr(entity, 'entity_id', None):
+                rv[entity.entity_id] = entity
+    return rv
+
+
+async def async_fanout(entities, command, **kwargs):
+    """Send command to all entities at the same time.
+
+    The plans of the command strings are compiled for every entity before
+    the first packet goes out, so that all the blasters start together; an
+    entity that cannot resolve one of them is skipped. Blasters emit
+    concurrently, entities of the same blaster take turns in its send
+    queue. Return a dict entity_id -> dict(ok, latency): ok is None if the
+    command was aborted.
+    """
+    loop = asyncio.get_event_loop()
+    results = dict()
+
+    async def emit(entity):
+        start = loop.time()
+        try:
+            ok = await entity.async_emit(command, **kwargs)
+        except Exception as ex:
+            _LOGGER.error("%s: fan-out error %s", entity.entity_id, ex)
+            ok = False
+        return entity.entity_id, dict(ok=ok, latency=round(loop.time() - start, 3))
+
+    ready = []
+    for entity in entities:
+        if all(entity.command2payloads(c) for c in command):
+            ready.append(entity)
+        else:
+            _LOGGER.error("%s: cannot resolve %s", entity.entity_id, command)
+            results[entity.entity_id] = dict(ok=False, latency=0)
+    results.update(await asyncio.gather(*[emit(e) for e in ready]))
+    return results
+
+
+async def async_fanout_service_handler(hass, service):
+    """Handle a fan-out command."""
+    entity_ids = service.data.get(ATTR_ENTITY_ID)
+    allentities = ir_entities(hass)
+    entities = [allentities[e] for e in entity_ids if e in allentities]
+    if len(entities) < len(entity_ids):
+        _LOGGER.error("entity_id: %s not found", ", ".join(
+            e for e in entity_ids if e not in allentities))
+    kwargs = dict(service.data)
+    del kwargs[ATTR_ENTITY_ID]
+    command = kwargs.pop(ATTR_COMMAND)
+    results = await async_fanout(entities, command, **kwargs)
+    _LOGGER.info("Sent %s to %d/%d remotes", command,
+                 sum(1 for r in results.values() if r['ok']), len(results))
+    hass.bus.async_fire(EVENT_FANOUT_RESULT, dict(command=command, results=results))
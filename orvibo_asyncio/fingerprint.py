@@ -0,0 +1,166 @@
+# Copied into broadlink_asyncio, gocomma and orvibo_asyncio: keep the
+# copies identical (see check_shared.py at the top of the repository).
+"""Fuzzy index of the IR codes used by the IR remote platforms."""
+import logging
+import sys
+from array import array
+from bisect import bisect_right
+from collections import namedtuple
+
+_LOGGER = logging.getLogger(__name__)
+
+FRAME_GAP = 20000
+MIN_FRAME = 4
+CLUSTER_RATIO = 1.5
+DEFAULT_TOLERANCE = 0.25
+
+Fingerprint = namedtuple('Fingerprint', ['pattern', 'centers'])
+
+
+def decode_shorts(data, signed=False):
+    """Return the durations of an array of little endian 16 bit timings."""
+    timings = array('h' if signed else 'H')
+    timings.frombytes(bytes(data[:len(data) - len(data) % 2]))
+    if sys.byteorder == 'big':
+        timings.byteswap()
+    return [abs(t) for t in timings] if signed else timings.tolist()
+
+
+def fingerprint(durations):
+    """Return the Fingerprint of the first frame of durations (None if too short).
+
+    The durations of the frame are clustered (a new cluster starts when a
+    duration is CLUSTER_RATIO times the smallest one of the current cluster)
+    and replaced by the index of their cluster: the pattern of indexes does
+    not change with the small timing differences between two captures of
+    the same key. The centers are the mean durations of the clusters.
+    """
+    frame = []
+    for d in durations:
+        if d >= FRAME_GAP and len(frame) % 2:
+            break
+        frame.append(d)
+    if len(frame) < MIN_FRAME:
+        return None
+    ordered = sorted(set(frame))
+    bounds = []
+    start = ordered[0]
+    for d in ordered[1:]:
+        if d > start * CLUSTER_RATIO:
+            bounds.append(d)
+            start = d
+    pattern = bytes([bisect_right(bounds, d) for d in frame])
+    sums = [0] * (len(bounds) + 1)
+    counts = [0] * (len(bounds) + 1)
+    for s, d in zip(pattern, frame):
+        sums[s] += d
+        counts[s] += 1
+    return Fingerprint(pattern, tuple(s // c for s, c in zip(sums, counts)))
+
+
+def common_prefix(a, b):
+    """Return the length of the common prefix of two byte strings."""
+    lo, hi = 0, min(len(a), len(b))
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if a[:mid] == b[:mid]:
+            lo = mid
+        else:
+            hi = mid - 1
+    return lo
+
+
+class CodeIndex(object):
+    """Index the codes of a command table by fingerprint.
+
+    Codes whose fingerprints have the same pattern and cluster centers within
+    tolerance are near-duplicates: finding them is a dict lookup on the
+    pattern. Fingerprints are cached by payload, so that rebuilding the index
+    after a change of the table only decodes the new codes. The durations
+    function turns a payload into its durations and raises ValueError (or
+    TypeError) for payloads that are not IR codes.
+    """
+
+    def __init__(self, durations, tolerance=DEFAULT_TOLERANCE):
+        self._durations = durations
+        self._tolerance = tolerance
+        self._cache = dict()
+        self._patterns = dict()
+        self._lengths = dict()
+
+    def __len__(self):
+        return sum(len(names) for names in self._patterns.values())
+
+    def fingerprint(self, payload):
+        """Return the Fingerprint of payload (None if it is not an IR code)."""
+        if payload in self._cache:
+            return self._cache[payload]
+        try:
+            fp = fingerprint(self._durations(payload))
+        except (ValueError, TypeError) as ex:
+            _LOGGER.debug("No fingerprint: %s", ex)
+            fp = None
+        self._cache[payload] = fp
+        return fp
+
+    def rebuild(self, table):
+        """Index the first IR code of each name of table (name -> payloads)."""
+        cache = self._cache
+        self._cache = dict()
+        self._patterns = dict()
+        self._lengths = dict()
+        for name, payloads in table.items():
+            for p in payloads:
+                if isinstance(p, float):
+                    continue
+                fp = cache[p] if p in cache else self.fingerprint(p)
+                self._cache[p] = fp
+                if fp is not None:
+                    self._patterns.setdefault(fp.pattern, []).append((name, fp))
+                    self._lengths.setdefault(len(fp.pattern), []).append((name, fp))
+                    break
+
+    def similar(self, fp1, fp2):
+        """Return True if two fingerprints are near-duplicates."""
+        return fp1.pattern == fp2.pattern and self._close(fp1.centers, fp2.centers)
+
+    def _close(self, centers1, centers2):
+        return len(centers1) == len(centers2) and all(
+            abs(a - b) <= self._tolerance * max(a, b) for a, b in zip(centers1, centers2))
+
+    def find(self, fp):
+        """Return the names of the codes that are near-duplicates of fp."""
+        return [name for name, other in self._patterns.get(fp.pattern, []) if self.similar(fp, other)]
+
+    def duplicates(self):
+        """Return the lists of names whose codes are near-duplicates."""
+        groups = []
+        for entries in self._patterns.values():
+            while len(entries) > 1:
+                name, fp = entries[0]
+                group = [name]
+                rest = []
+                for other in entries[1:]:
+                    if self.similar(fp, other[1]):
+                        group.append(other[0])
+                    else:
+                        rest.append(other)
+                if len(group) > 1:
+                    groups.append(group)
+                entries = rest
+        return groups
+
+    def closest(self, fp):
+        """Return the name of the code most similar to fp and a 0 - 1 score.
+
+        Codes of the same remote usually share protocol timings and address
+        bits: among the codes having the same frame length and similar
+        cluster centers, the one sharing the longest pattern prefix wins.
+        """
+        best = (None, 0.0)
+        for name, other in self._lengths.get(len(fp.pattern), []):
+            if self._close(fp.centers, other.centers):
+                score = common_prefix(fp.pattern, other.pattern) / len(fp.pattern)
+                if score > best[1]:
+                    best = (name, score)
+        return best
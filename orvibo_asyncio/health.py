@@ -0,0 +1,156 @@
+# Copied into broadlink_asyncio, gocomma and orvibo_asyncio: keep the
+# copies identical (see check_shared.py at the top of the repository).
+"""Per host health monitor used by the IR remote platforms."""
+import asyncio
+import logging
+import random
+
+from .scheduler import PRIORITY_BACKGROUND
+
+_LOGGER = logging.getLogger(__name__)
+
+FAST_PROBE_INTERVAL = 5
+HEALTH_OWNER = '__health__'
+
+
+def get_health_monitor(hassdata, key, factory):
+    """Return the monitor of key (host or MAC), creating it with factory if needed."""
+    monitors = hassdata.setdefault(__name__, dict())
+    if key not in monitors:
+        monitors[key] = factory()
+    return monitors[key]
+
+
+class HealthMonitor(object):
+    """Check whether an IR blaster is reachable.
+
+    There is one monitor per device, shared by all the entities using it. The
+    probe runs through the send scheduler of the device so that it never
+    interleaves with commands. When the device is healthy it is probed every
+    slow seconds, and not at all while commands keep being acknowledged;
+    after a failure it is probed again after FAST_PROBE_INTERVAL seconds,
+    doubling the interval at each new failure up to slow seconds. A failed
+    command triggers a probe immediately. The first probe waits a random
+    time up to fast seconds, so that the devices are not all probed at once
+    at startup (it is skipped if a command has succeeded meanwhile).
+    """
+
+    def __init__(self, name, probe, scheduler, slow, fast=FAST_PROBE_INTERVAL):
+        self._name = name
+        self._probe = probe
+        self._scheduler = scheduler
+        self._slow = slow
+        self._fast = fast
+        self._online = None
+        self._failures = 0
+        self._last_ok = None
+        self._paused = False
+        self._listeners = []
+        self._task = None
+        self._wakeup = None
+
+    @property
+    def online(self):
+        """Return True/False once the device has been checked, else None."""
+        return self._online
+
+    @property
+    def scheduler(self):
+        """Return the send scheduler of the device."""
+        return self._scheduler
+
+    @property
+    def interval(self):
+        """Return the current probe interval in seconds."""
+        if not self._failures:
+            return self._slow
+        return min(self._fast * 2 ** (self._failures - 1), self._slow)
+
+    def add_listener(self, listener):
+        """Call listener(online) on each change; return a remove function."""
+        self._listeners.append(listener)
+        if self._task is None:
+            self._task = asyncio.get_event_loop().create_task(self._loop())
+
+        def remove_listener():
+            self._listeners.remove(listener)
+            if not self._listeners and self._task is not None:
+                self._task.cancel()
+                self._task = None
+        return remove_listener
+
+    def pause(self):
+        """Stop probing (e.g. while the device is learning)."""
+        self._paused = True
+
+    def resume(self):
+        self._paused = False
+
+    def report(self, ok):
+        """Account the outcome of a real command sent to the device."""
+        if ok:
+            self._last_ok = asyncio.get_event_loop().time()
+            self._failures = 0
+            self._set_online(True)
+        else:
+            self._last_ok = None
+            self._wake()
+
+    async def probe_now(self):
+        """Probe the device and return the result (None if not probed)."""
+        if self._paused:
+            return None
+        rv = await self._scheduler.submit(
+            HEALTH_OWNER, self._probe_job, priority=PRIORITY_BACKGROUND)
+        if rv is None:
+            return None
+        if rv:
+            self._last_ok = asyncio.get_event_loop().time()
+            self._failures = 0
+        else:
+            self._failures += 1
+        _LOGGER.debug("%s: probe %s, next in %ds", self._name,
+                      "OK" if rv else "FAILED", self.interval)
+        self._set_online(rv)
+        return rv
+
+    async def _probe_job(self):
+        try:
+            return bool(await self._probe())
+        except Exception as ex:
+            _LOGGER.error("%s: probe error %s", self._name, ex)
+            return False
+
+    def _set_online(self, online):
+        if online != self._online:
+            self._online = online
+            _LOGGER.info("%s is now %s", self._name, "online" if online else "offline")
+            for listener in list(self._listeners):
+                listener(online)
+
+    def _wake(self):
+        if self._wakeup is not None and not self._wakeup.done():
+            self._wakeup.set_result(True)
+
+    async def _loop(self):
+        loop = asyncio.get_event_loop()
+        await asyncio.sleep(random.uniform(0, self._fast))
+        woken = False
+        while True:
+            if not woken and self._last_ok is not None:
+                idle = loop.time() - self._last_ok
+                if idle < self._slow:
+                    delay = self._slow - idle
+                else:
+                    delay = 0
+            else:
+                delay = 0
+            if delay <= 0:
+                await self.probe_now()
+                delay = self.interval
+            self._wakeup = loop.create_future()
+            try:
+                done, _ = await asyncio.wait([self._wakeup], timeout=delay)
+            finally:
+                self._wakeup = None
+            woken = bool(done)
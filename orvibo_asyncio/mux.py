@@ -0,0 +1,118 @@
+"""UDP endpoint shared by all the Orvibo devices of the integration."""
+import asyncio
+import logging
+from functools import partial
+
+from asyncio_orvibo.asyncio_udp import Endpoint, open_datagram_endpoint
+from asyncio_orvibo.orvibo_udp import OrviboUDP, PORT
+
+_LOGGER = logging.getLogger(__name__)
+
+QUEUE_SIZE = 32
+DISCOVERY_ID = b'\x71\x61'
+
+
+class MuxEndpoint(Endpoint):
+    """Library endpoint demultiplexing the datagrams it receives.
+
+    Replies are queued by sender IP, also while a discovery is running:
+    only discovery replies go to the queue of the broadcast addresses of
+    the running discoveries, which are the destinations of the protocol
+    calls made with is_broadcast (the library sets a shared flag instead,
+    which would also take the unicast sends made meanwhile). A
+    datagram from a device nobody has talked to is not queued, and a full
+    queue drops its oldest datagram. Every datagram is also handed to the
+    mux, which passes it to the listeners of the MAC it carries.
+    """
+
+    def __init__(self, mux):
+        Endpoint.__init__(self, QUEUE_SIZE)
+        self._mux = mux
+        self._broadcasts = set()
+
+    def _init_queue(self, addr):
+        key = addr[0]
+        if key not in self._queue:
+            self._queue[key] = asyncio.Queue(self._queue_size)
+        return key
+
+    async def protocol(self, data, addr, check_data_fun, timeout, retry=3, is_broadcast=False):
+        if not is_broadcast:
+            return await Endpoint.protocol(self, data, addr, check_data_fun, timeout, retry)
+        self._broadcasts.add(addr[0])
+        try:
+            return await Endpoint.protocol(self, data, addr, check_data_fun, timeout, retry)
+        finally:
+            self._broadcasts.discard(addr[0])
+
+    def feed_datagram(self, data, addr):
+        if data is None:
+            # Endpoint closed: wake up the receiver of queue addr
+            queue = self._queue.get(addr)
+            if queue is not None and not queue.full():
+                queue.put_nowait((None, addr))
+            return
+        self._mux.dispatch(data, addr)
+        if data[4:6] == DISCOVERY_ID and self._broadcasts:
+            keys = list(self._broadcasts)
+        else:
+            keys = [addr[0]]
+        for key in keys:
+            queue = self._queue.get(key)
+            if queue is None:
+                continue
+            if queue.full():
+                queue.get_nowait()
+                _LOGGER.debug("Queue of %s is full: dropping oldest datagram", key)
+            queue.put_nowait((data, addr))
+
+
+class OrviboMux(object):
+    """Own the UDP endpoint (port PORT) used by every AllOne and S20.
+
+    The library sends all its packets through one class level endpoint:
+    install() makes the library open a MuxEndpoint instead, also when it
+    re-opens it after a network error. Listeners registered for a MAC get
+    all the datagrams carrying it, including the unsolicited ones; the ones
+    registered for None get every datagram.
+    """
+
+    def __init__(self):
+        self._listeners = dict()
+        self.received = 0
+
+    def install(self):
+        if OrviboUDP._local is not None and not isinstance(OrviboUDP._local, MuxEndpoint):
+            OrviboUDP.destroy_local()
+        OrviboUDP.init_local = staticmethod(self.init_local)
+
+    async def init_local(self, **kwargs):
+        if not OrviboUDP._local:
+            try:
+                OrviboUDP._local = await open_datagram_endpoint(
+                    '0.0.0.0', PORT, endpoint_factory=partial(MuxEndpoint, self),
+                    allow_broadcast=True, **kwargs)
+                _LOGGER.info("Opened shared endpoint on port %d", PORT)
+            except Exception as ex:
+                _LOGGER.error("Open endpoint error %s", ex)
+                OrviboUDP._local = None
+        return OrviboUDP._local
+
+    def add_listener(self, mac, listener):
+        """Call listener(data, addr) for each datagram of mac; return a remove function."""
+        self._listeners.setdefault(mac, []).append(listener)
+
+        def remove_listener():
+            self._listeners[mac].remove(listener)
+            if not self._listeners[mac]:
+                del self._listeners[mac]
+        return remove_listener
+
+    def dispatch(self, data, addr):
+        self.received += 1
+        mac = OrviboUDP.mac_from_data(data)
+        for listener in list(self._listeners.get(mac, ())) + list(self._listeners.get(None, ())):
+            try:
+                listener(data, addr)
+            except Exception as ex:
+                _LOGGER.error("Error handling datagram from %s: %s", addr[0], ex)
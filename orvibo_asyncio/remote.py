@@ -1,25 +1,37 @@
 """Support for the Xiaomi IR Remote (Chuangmi IR)."""
-import logging
 import asyncio
+import logging
 from datetime import timedelta
-import re
+from functools import partial
 
 import voluptuous as vol
 import binascii
 from base64 import b64decode, b64encode
 
 from homeassistant.components.remote import (
-    PLATFORM_SCHEMA, DOMAIN, ATTR_NUM_REPEATS, ATTR_DELAY_SECS,
-    DEFAULT_DELAY_SECS, RemoteDevice, ATTR_HOLD_SECS, DEFAULT_HOLD_SECS)
+    PLATFORM_SCHEMA, DOMAIN, ATTR_NUM_REPEATS, ATTR_DELAY_SECS, ATTR_COMMAND,
+    DEFAULT_DELAY_SECS, RemoteDevice, ATTR_HOLD_SECS, DEFAULT_HOLD_SECS,
+    DEFAULT_NUM_REPEATS)
 from homeassistant.const import (
     CONF_NAME, CONF_HOST, CONF_MAC, CONF_TIMEOUT,
     ATTR_ENTITY_ID, STATE_OFF, STATE_ON)
+from homeassistant.core import callback
 import homeassistant.helpers.config_validation as cv
-from homeassistant.util import Throttle
+from homeassistant.helpers.event import async_track_state_change
 from .const import (CONF_BROADCAST_ADDRESS, ORVIBO_ASYNCIO_DATA_KEY)
-from . import get_orvibo_class
-
-MIN_TIME_BETWEEN_UPDATES = timedelta(minutes=30)
+from . import get_orvibo_class, get_orvibo_discovery
+from .coalescer import COALESCE_SCHEMA, Coalescer, split_repeat
+from .commands import CommandCompiler, CommandStore
+from .fanout import async_register_fanout
+from .fingerprint import CodeIndex, decode_shorts
+from .health import HealthMonitor, get_health_monitor
+from .learning import LearningSession
+from .scheduler import (SendScheduler, PRIORITIES, PRIORITY_BACKGROUND,
+                        PRIORITY_INTERACTIVE)
+from .store import LearnedStore
+from .emitter import SerialEmitter
+
+HEALTH_CHECK_INTERVAL = timedelta(minutes=5)
 
 REQUIREMENTS = ['asyncio-orvibo>=1.18']
 
@@ -32,17 +44,28 @@ STATE_LEARNING_KEY = "learning_key"
 
 SERVICE_LEARN = 'orvibo_asyncio_remote_learn'
 SERVICE_DISCOVERY = 'orvibo_asyncio_remote_discovery'
+SERVICE_SEND = 'orvibo_asyncio_remote_send'
+SERVICE_ABORT = 'orvibo_asyncio_remote_abort'
+SERVICE_DEDUP = 'orvibo_asyncio_remote_dedup'
 DATA_KEY = 'remote.orvibo_asyncio'
 
 CONF_REMOTES = 'remotes'
 CONF_KEYS = 'keys'
+CONF_PRIORITY = 'priority'
+CONF_SUPERSEDE = 'supersede'
+CONF_REMOTE = 'remote'
+CONF_COALESCE = 'coalesce'
 
 DEFAULT_TIMEOUT = 5
+DEFAULT_LEARNED_REMOTE = 'learned'
+# About the length of a common IR frame (e.g. NEC, 108 ms) plus a gap
+REPEAT_INTERVAL = 0.15
 
 LEARN_COMMAND_SCHEMA = vol.Schema({
     vol.Required(ATTR_ENTITY_ID): vol.All(str),
     vol.Optional(CONF_TIMEOUT, default=30): vol.All(int, vol.Range(min=10)),
-    vol.Optional(CONF_KEYS, default=["NA_1"]): vol.All(cv.ensure_list, [cv.slug])
+    vol.Optional(CONF_KEYS, default=["NA_1"]): vol.All(cv.ensure_list, [cv.slug]),
+    vol.Optional(CONF_REMOTE): cv.slug
 })
 
 DISCOVERY_COMMAND_SCHEMA = vol.Schema({
@@ -50,6 +73,24 @@ DISCOVERY_COMMAND_SCHEMA = vol.Schema({
     vol.Optional(CONF_BROADCAST_ADDRESS, default='255.255.255.255'): cv.string,
 })
 
+SEND_COMMAND_SCHEMA = vol.Schema({
+    vol.Required(ATTR_ENTITY_ID): vol.All(str),
+    vol.Required(ATTR_COMMAND): vol.All(cv.ensure_list, [cv.string]),
+    vol.Optional(ATTR_NUM_REPEATS, default=DEFAULT_NUM_REPEATS): cv.positive_int,
+    vol.Optional(ATTR_DELAY_SECS, default=DEFAULT_DELAY_SECS): vol.Coerce(float),
+    vol.Optional(ATTR_HOLD_SECS, default=DEFAULT_HOLD_SECS): vol.Coerce(float),
+    vol.Optional(CONF_PRIORITY): vol.In(PRIORITIES),
+    vol.Optional(CONF_SUPERSEDE, default=False): cv.boolean,
+})
+
+ABORT_COMMAND_SCHEMA = vol.Schema({
+    vol.Required(ATTR_ENTITY_ID): vol.All(str),
+})
+
+DEDUP_COMMAND_SCHEMA = vol.Schema({
+    vol.Required(ATTR_ENTITY_ID): vol.All(str),
+})
+
 COMMAND_SCHEMA = vol.All(cv.ensure_list, [cv.string])
 
 KEYS_SCHEMA = cv.schema_with_slug_keys(COMMAND_SCHEMA)
@@ -62,9 +103,45 @@ PLATFORM_SCHEMA = PLATFORM_SCHEMA.extend({
         vol.All(int, vol.Range(min=1)),
     vol.Optional(CONF_REMOTES, default={}):
         cv.schema_with_slug_keys(KEYS_SCHEMA),
+    vol.Optional(CONF_COALESCE, default=[]): COALESCE_SCHEMA,
 })
 
 
+def compact_command(command):
+    """Return the bytes of an `r` or `h` command string (other commands as they are)."""
+    pid = command[0:1]
+    try:
+        if pid == 'r':
+            return b64decode(command[1:] + ('=' * (-len(command[1:]) % 4)))
+        elif pid == 'h':
+            return binascii.unhexlify(command[1:])
+    except ValueError as ex:
+        _LOGGER.error("Invalid command %s: %s", command, ex)
+    return command
+
+
+def merge_commands(remotes, learned):
+    """Merge the learned codes into the configured ones.
+
+    The codes are decoded and held once in a CommandStore, whose read only
+    views are the tables of the entities. Return the table of the main
+    entity (`remote@key` names) and the tables of the remotes.
+    """
+    cmdstore = CommandStore(remotes, learned, compact_command)
+    return cmdstore.view(), dict((remnm, cmdstore.view(remnm)) for remnm in cmdstore.remotes)
+
+
+def learned_listener(remotes, store, main, children):
+    """Return the store listener hot merging the learned codes into the tables."""
+    @callback
+    def async_learned_changed():
+        allcmnds, remtables = merge_commands(remotes, store.remotes)
+        main.commands = allcmnds
+        for remnm, child in children.items():
+            child.commands = remtables[remnm]
+    return async_learned_changed
+
+
 async def async_setup_platform(hass, config, async_add_entities,
                                discovery_info=None):
     AllOne = get_orvibo_class(hass.data, 'AllOne')
@@ -78,19 +155,32 @@ async def async_setup_platform(hass, config, async_add_entities,
     host = config.get(CONF_HOST)
     allone_obj = AllOne((host, PORT), mac=config.get(CONF_MAC), timeout=config.get(CONF_TIMEOUT))
     remotes = config.get(CONF_REMOTES)
-    allcmnds = dict()
-    for remnm, remkeys in remotes.items():
-        for keynm, keycmnds in remkeys.items():
-            allcmnds[remnm + "@" + keynm] = keycmnds
-    xiaomi_miio_remote = AllOneRemote(friendly_name, allone_obj, allcmnds, '')
+    store = LearnedStore(hass, DATA_KEY + "." + friendly_name, AllOneRemote.decode_raw)
+    await store.async_load()
+    allcmnds, remtables = merge_commands(remotes, store.remotes)
+    # One health monitor (and send scheduler) per host, whatever the number
+    # of entities using it
+    health = get_health_monitor(hass.data, host, partial(
+        HealthMonitor, friendly_name, allone_obj.subscribe_if_necessary,
+        SendScheduler(friendly_name), HEALTH_CHECK_INTERVAL.total_seconds()))
+    scheduler = health.scheduler
+    coalescer = Coalescer(config.get(CONF_COALESCE)) if config.get(CONF_COALESCE) else None
+    xiaomi_miio_remote = AllOneRemote(friendly_name, allone_obj, allcmnds, '', scheduler, health, store,
+                                      coalescer)
     hassdata[friendly_name] = xiaomi_miio_remote
     hassdata[host] = xiaomi_miio_remote
     allones.append(xiaomi_miio_remote)
-    for remnm, remkeys in remotes.items():
-        xiaomi_miio_remote = AllOneRemote(friendly_name+"_"+remnm, allone_obj, remkeys, friendly_name)
+    children = dict()
+    for remnm, remkeys in remtables.items():
+        xiaomi_miio_remote = AllOneRemote(friendly_name+"_"+remnm, allone_obj, remkeys, friendly_name, scheduler, health, store,
+                                          coalescer)
+        hassdata[friendly_name+"_"+remnm] = xiaomi_miio_remote
         allones.append(xiaomi_miio_remote)
+        children[remnm] = xiaomi_miio_remote
 
     async_add_entities(allones)
+    store.add_listener(learned_listener(remotes, store, allones[0], children))
+    async_register_fanout(hass)
 
     async def async_service_handler(service):
         """Handle a learn command."""
@@ -105,53 +195,50 @@ async def async_setup_platform(hass, config, async_add_entities,
 
             timeout = service.data.get(CONF_TIMEOUT, 30)
             keynames = service.data.get(CONF_KEYS, ["NA_1"])
-            numkeys = len(keynames)
+            remote = service.data.get(CONF_REMOTE) or entity.remote or DEFAULT_LEARNED_REMOTE
             pn = hass.components.persistent_notification
-            allnot = ''
-            msg = ''
-
-            for xx in range(numkeys):
-                try:
-                    if await entity.enter_learning_mode():
-                        await asyncio.sleep(3)
-                        keyname = keynames[xx]
-                        msg = "Press the key you want Home Assistant to learn [%s] %d/%d" % (keyname, xx+1, numkeys)
-                        _LOGGER.info(msg)
-                        pn.async_create(msg, title='Broadlink RM', notification_id='broadlink_asyncio_learning')
-                        packet = await entity.get_learned_key(timeout, keyname)
-                        if packet:
-                            b64k = b64encode(packet).decode('utf8')
-                            notif = '{}:\n    - "r{}"\n'.format(keyname, b64k)
-                            msg = "Received is: r{} or h{}".format(b64k, binascii.hexlify(packet).decode('utf8'))
-                        else:
-                            notif = ''
-                            msg = "Did not receive any key"
-                        _LOGGER.info(msg)
-                        allnot += notif + '\n'
-                        pn.async_create(allnot, title='Broadlink RM', notification_id='broadlink_asyncio_learned')
-                        pn.async_dismiss(notification_id='broadlink_asyncio_learning')
-                    else:
-                        msg = "Failed entering learning mode"
-                        _LOGGER.error(msg)
-                        pn.async_create(msg, title='Broadlink RM', notification_id='broadlink_asyncio_learning')
-                except BaseException as ex:
-                    _LOGGER.error("Learning error %s", ex)
-            msg = "Learning ends NOW"
-            _LOGGER.info(msg)
-            await entity.exit_learning_mode()
+
+            def prompt(keyname, xx, numkeys):
+                msg = "Press the key you want Home Assistant to learn [%s] %d/%d" % (keyname, xx+1, numkeys)
+                _LOGGER.info(msg)
+                pn.async_create(msg, title='Broadlink RM', notification_id='broadlink_asyncio_learning')
+
+            # The device leaves learning mode after each key: the session puts it
+            # back in learning mode right after each capture
+            session = LearningSession(entity, timeout, remote, rearm=True)
+            try:
+                if not await session.run(keynames, prompt):
+                    msg = "Failed entering learning mode"
+                    _LOGGER.error(msg)
+                    pn.async_create(msg, title='Broadlink RM', notification_id='broadlink_asyncio_learning')
+                    return
+            except Exception as ex:
+                _LOGGER.error("Learning error %s", ex)
+            pn.async_dismiss(notification_id='broadlink_asyncio_learning')
+            pn.async_create(session.notification(), title='Broadlink RM', notification_id='broadlink_asyncio_learned')
+            _LOGGER.info("Learning ends NOW: %d/%d keys learned", len(session.learned), len(keynames))
 
         elif service.service == SERVICE_DISCOVERY:
             hassdata = hass.data[DATA_KEY]
             timeout = service.data.get(CONF_TIMEOUT, 5)
             broadcast = service.data.get(CONF_BROADCAST_ADDRESS, '255.255.255.255')
             new_allones = []
-            disc = await AllOne.discovery(broadcast_address=broadcast, timeout=timeout)
+            discovery = get_orvibo_discovery(hass.data)
+            await discovery.async_discover(broadcast, timeout)
+            disc = discovery.devices('AllOne')
             for _, v in disc.items():
                 if v.hp[0] not in hassdata:
                     mac = AllOne.print_mac(v.mac)
                     name = "s_"+mac
                     msg = "Discovered new AllOne device %s" % v
-                    xiaomi_miio_remote = AllOneRemote(name, v, {}, '')
+                    health = get_health_monitor(hass.data, v.hp[0], partial(
+                        HealthMonitor, name, v.subscribe_if_necessary,
+                        SendScheduler(name), HEALTH_CHECK_INTERVAL.total_seconds()))
+                    store = LearnedStore(hass, DATA_KEY + "." + name, AllOneRemote.decode_raw)
+                    await store.async_load()
+                    allcmnds, _ = merge_commands(dict(), store.remotes)
+                    xiaomi_miio_remote = AllOneRemote(name, v, allcmnds, '', health.scheduler, health, store)
+                    store.add_listener(learned_listener(dict(), store, xiaomi_miio_remote, dict()))
                     new_allones.append(xiaomi_miio_remote)
                     hassdata[v.hp[0]] = xiaomi_miio_remote
                     hassdata[name] = xiaomi_miio_remote
@@ -168,18 +255,68 @@ async def async_setup_platform(hass, config, async_add_entities,
     hass.services.async_register(DOMAIN, SERVICE_DISCOVERY, async_service_handler,
                                  schema=DISCOVERY_COMMAND_SCHEMA)
 
+    async def async_send_service_handler(service):
+        """Handle a send or abort command."""
+        entity_id = service.data.get(ATTR_ENTITY_ID)
+        if entity_id.startswith("remote."):
+            entity_id = entity_id[len("remote."):]
+        if entity_id not in hass.data[DATA_KEY]:
+            _LOGGER.error("entity_id: '%s' not found", entity_id)
+            return
+        entity = hass.data[DATA_KEY][entity_id]
+        if service.service == SERVICE_ABORT:
+            entity.scheduler.abort()
+        else:
+            kwargs = dict(service.data)
+            del kwargs[ATTR_ENTITY_ID]
+            await entity.async_send_command(kwargs.pop(ATTR_COMMAND), **kwargs)
+
+    hass.services.async_register(DOMAIN, SERVICE_SEND, async_send_service_handler,
+                                 schema=SEND_COMMAND_SCHEMA)
+    hass.services.async_register(DOMAIN, SERVICE_ABORT, async_send_service_handler,
+                                 schema=ABORT_COMMAND_SCHEMA)
+
+    async def async_dedup_service_handler(service):
+        """Handle a dedup command."""
+        entity_id = service.data.get(ATTR_ENTITY_ID)
+        if entity_id.startswith("remote."):
+            entity_id = entity_id[len("remote."):]
+        if entity_id not in hass.data[DATA_KEY]:
+            _LOGGER.error("entity_id: '%s' not found", entity_id)
+            return
+        entity = hass.data[DATA_KEY][entity_id]
+        groups = entity.index.duplicates()
+        if groups:
+            msg = "Keys with the same code:\n" + "\n".join([" = ".join(g) for g in groups])
+        else:
+            msg = "No duplicate key found among %d codes" % len(entity.index)
+        _LOGGER.info(msg)
+        hass.components.persistent_notification.async_create(
+            msg, title='AllOne remote', notification_id='orvibo_asyncio_remote_dedup')
+
+    hass.services.async_register(DOMAIN, SERVICE_DEDUP, async_dedup_service_handler,
+                                 schema=DEDUP_COMMAND_SCHEMA)
+
 
 class AllOneRemote(RemoteDevice):
     """Representation of a Xiaomi Miio Remote device."""
 
-    def __init__(self, friendly_name, device, commands, main_entity):
+    def __init__(self, friendly_name, device, commands, main_entity, scheduler, health, store,
+                 coalescer=None):
         """Initialize the remote."""
         self._name = friendly_name
         self._device = device
+        self._scheduler = scheduler
+        self._health = health
+        self._store = store
         self._state = STATE_OFF
-        self._commands = commands
+        self._compiler = CommandCompiler(commands, self.decode_raw)
+        self._index = CodeIndex(self.durations)
+        self._indexed = False
         self._states = dict(last_learned=dict(), key_to_learn='')
         self._main = main_entity
+        self._coalescer = coalescer
+        self._unsub_main = None
 
     @property
     def name(self):
@@ -203,11 +340,52 @@ class AllOneRemote(RemoteDevice):
 
     @property
     def should_poll(self):
-        """We should not be polled for device up state."""
+        """The health monitor pushes the state of the main entity, the others mirror it."""
+        return False
+
+    async def async_added_to_hass(self):
+        """Start following the health monitor or the state of the main entity."""
+        if len(self._main):
+            self._unsub_main = async_track_state_change(
+                self.hass, "remote." + self._main, self._async_main_changed)
+            self._mirror_main(self.hass.states.get("remote." + self._main))
+        else:
+            self._unsub_main = self._health.add_listener(self._async_health_changed)
+
+    async def async_will_remove_from_hass(self):
+        """Stop following the state of the main entity."""
+        if self._unsub_main:
+            self._unsub_main()
+            self._unsub_main = None
+
+    @callback
+    def _async_main_changed(self, entity_id, old_state, new_state):
+        if self._mirror_main(new_state):
+            self.async_schedule_update_ha_state()
+
+    @callback
+    def _async_health_changed(self, online):
+        if self._state.startswith(STATE_LEARNING):
+            return
+        if online:
+            if self._state == STATE_OFF:
+                self._state = STATE_ON
+        else:
+            self._state = STATE_OFF
+            self._states['last_learned'] = dict()
+        _LOGGER.debug("New state is %s", self._state)
+        self.async_schedule_update_ha_state()
+
+    def _mirror_main(self, sto):
+        if sto is None:
+            return False
+        self._state = sto.state
+        self._states = dict(sto.attributes)
         return True
 
     async def enter_learning_mode(self, timeout=-1, retry=3):
         self._state = STATE_LEARNING_INIT
+        self._health.pause()
         # self._states['last_learned'] = dict()
         await self.async_update_ha_state()
         rv = await self._device.enter_learning_mode(timeout=timeout, retry=retry)
@@ -217,6 +395,7 @@ class AllOneRemote(RemoteDevice):
 
     async def exit_learning_mode(self, timeout=-1, retry=3):
         self._state = STATE_ON
+        self._health.resume()
         await self.async_update_ha_state()
         return True
 
@@ -225,33 +404,82 @@ class AllOneRemote(RemoteDevice):
         self._states['key_to_learn'] = keyname
         await self.async_update_ha_state()
         rv = await self._device.get_learned_key(timeout=timeout)
-        if rv:
-            self._states['last_learned'][keyname] = binascii.hexlify(rv).decode('utf8')
         self._state = STATE_LEARNING_OK
         self._states['key_to_learn'] = ''
         await self.async_update_ha_state()
         return rv
 
+    def clear_learned(self):
+        """Empty the last_learned attribute (at the start of a learning session)."""
+        self._states['last_learned'] = dict()
+
+    def save_learned_key(self, keyname, packet, remote):
+        """Save a learned key in the store of the device."""
+        self._store.async_add(remote, keyname, ['r' + b64encode(packet).decode('utf8')])
+        self._states['last_learned'][keyname] = remote + "@" + keyname
+
+    @property
+    def store(self):
+        """Return the store of the learned keys of the device."""
+        return self._store
+
+    @property
+    def remote(self):
+        """Return the remote of a child entity ('' for the main entity)."""
+        return self._name[len(self._main) + 1:] if len(self._main) else ''
+
+    @property
+    def commands(self):
+        """Return the command table."""
+        return self._compiler.commands
+
+    @commands.setter
+    def commands(self, value):
+        self._compiler.commands = value
+        self._indexed = False
+
+    @property
+    def index(self):
+        """Return the fuzzy index of the codes of the command table."""
+        if not self._indexed:
+            self._index.rebuild(self._compiler.commands)
+            self._indexed = True
+        return self._index
+
+    def similar_keys(self, packet):
+        """Return the remote@key names of the codes that are near-duplicates of packet."""
+        fp = self.index.fingerprint(packet)
+        if fp is None:
+            return []
+        return [self._full_name(name) for name in self.index.find(fp)]
+
+    def closest_remote(self, packet):
+        """Return the remote whose codes look the most like packet and a 0 - 1 score."""
+        fp = self.index.fingerprint(packet)
+        if fp is None:
+            return None, 0.0
+        name, score = self.index.closest(fp)
+        if name is None:
+            return None, 0.0
+        return self._full_name(name).partition('@')[0], score
+
+    def _full_name(self, name):
+        return self.remote + "@" + name if len(self._main) else name
+
+    @property
+    def scheduler(self):
+        """Return the send scheduler shared by the entities of the device."""
+        return self._scheduler
+
     @property
     def device_state_attributes(self):
         """Hide remote by default."""
-        return self._states
+        return dict(self._states, learned_keys=len(self._store), send_queue=self._scheduler.metrics)
 
-    @Throttle(MIN_TIME_BETWEEN_UPDATES)
     async def async_update(self):
-        if len(self._main):
-            sto = self.hass.states.get("remote."+self._main)
-            self._state = sto.state
-            self._states = sto.attributes
-        else:
-            if not self._state.startswith(STATE_LEARNING):
-                if await self._device.subscribe_if_necessary():
-                    if self._state == STATE_OFF:
-                        self._state = STATE_ON
-                else:
-                    self._state = STATE_OFF
-                    self._states['last_learned'] = dict()
-                _LOGGER.debug("New state is %s", self._state)
+        """Probe the device now: only called when an update is forced."""
+        if not len(self._main):
+            await self._health.probe_now()
 
     async def async_turn_on(self, **kwargs):
         """Turn the device on."""
@@ -263,18 +491,24 @@ class AllOneRemote(RemoteDevice):
         _LOGGER.error("Device does not support turn_off, "
                       "please use 'remote.send_command' to send commands.")
 
-    async def _send_command(self, packet, totretry):
+    async def _send_command(self, packet, emitter, pacer):
         try:
             if type(packet) is tuple:
                 num = packet[1]
-                pid = packet[0][0]
-                packet = packet[0][1:]
+                packet = packet[0]
+            else:
+                num = -1
+            if isinstance(packet, bytes):
+                # Already decoded by merge_commands
+                pid = 'b'
             else:
                 pid = packet[0]
                 packet = packet[1:]
-                num = -1
             _LOGGER.info("Pid is %s, Len is %d Rep is %d", pid, len(packet), num)
-            if pid == 'r':
+            if pid == 'b':
+                payload = packet
+                add = "bytes"
+            elif pid == 'r':
                 extra = len(packet) % 4
                 if extra > 0:
                     packet = packet + ('=' * (4 - extra))
@@ -284,65 +518,127 @@ class AllOneRemote(RemoteDevice):
                 payload = binascii.unhexlify(packet)
                 add = "unhex"
             elif pid == "t":
-                await asyncio.sleep(float(packet))
-                return True
+                return float(packet)
             else:
-                return False
+                return None
         except BaseException as ex:
             _LOGGER.error("Err1: %s ", ex)
-            return False
+            return None
         if num <= 0:
             num = 1
-        for _ in range(num):
+        # Repeats are paced about one IR frame length apart: the wait lets
+        # interactive sequences in and is cut short by an abort. The emitter
+        # still waits for the ack of a repeat before sending the next one
+        for i in range(num):
+            if i:
+                pacer.delay(REPEAT_INTERVAL)
+                await pacer.wait()
             _LOGGER.info("I am sending %s, Final len is %d", add, len(payload))
-            await self._device.emit_ir(payload, retry=totretry)
+            await emitter.send(payload)
         return False
 
     def command2payloads(self, command):
         _LOGGER.info("Searching for %s", command)
-        if command in self._commands:
-            _LOGGER.info("%s found in commands", command)
-            return self._commands[command]
-        elif command.startswith('@'):
-            return [command[1:]]
-        else:
-            mo = re.search("^(([a-zA-Z0-9_]*)@)?ch([0-9]+)$", command)
-            pre = '' if not mo or not mo[1] else mo[1]
-            if mo is not None and pre+'ch1' in self._commands:
-                commands = [self._commands[pre + 'ch' + x][0] for x in mo[3]]
+        return self._compiler.get(command)
+
+    @staticmethod
+    def durations(payload):
+        """Return the durations of a command string or of a learned key.
+
+        The AllOne format is not documented: the payload is read as an array
+        of little endian signed 16 bit timings, which is only used to compare
+        the codes with each other (their pattern), never to time emissions.
+        """
+        if isinstance(payload, str):
+            pid = payload[0:1]
+            packet = payload[1:]
+            if pid == 'r':
+                payload = b64decode(packet + ('=' * (-len(packet) % 4)))
+            elif pid == 'h':
+                payload = binascii.unhexlify(packet)
             else:
-                mo = re.search("^([a-zA-Z0-9_]+)#([0-9]+)$", command)
-                if mo is not None:
-                    nm = mo.group(1)
-                    num = int(mo.group(2))
-                    _LOGGER.info("%s rep %d. Searching...", nm, num)
-                    if nm in self._commands:
-                        _LOGGER.info("%s found in commands", nm)
-                        cmdl = self._commands[nm]
-                        return list(zip(cmdl, [num for _ in range(len(cmdl))]))
-                    else:
-                        return []
-                else:
-                    commands = [command]
-            return commands
+                raise ValueError('Not an IR code: %s' % payload)
+        return decode_shorts(payload, signed=True)
+
+    @staticmethod
+    def decode_raw(command):
+        if command[0:1] in ('r', 'h', 't'):
+            return [command]
+        _LOGGER.error("Err1: %s is not a code", command)
+        return []
 
     async def async_send_command(self, command, **kwargs):
         """Send a command."""
+        if self._coalescer is not None and len(command) == 1 and\
+                kwargs.get(ATTR_NUM_REPEATS, 1) == 1 and not kwargs.get(CONF_SUPERSEDE, False):
+            key, num = split_repeat(command[0])
+            key = self._full_name(key)
+            if key in self._coalescer:
+                await self._coalescer.submit(key, num, partial(self._async_send_merged, kwargs))
+                return
+        await self._async_submit(command, **kwargs)
+
+    async def _async_send_merged(self, kwargs, key, num):
+        """Send num presses of key (a remote@key name) coalesced into one command."""
+        if len(self._main):
+            key = key[len(self.remote) + 1:]
+        return await self._async_submit([key if num == 1 else '%s#%d' % (key, num)], **kwargs)
+
+    async def async_emit(self, command, **kwargs):
+        """Send command without coalescing it.
+
+        Return True if every packet was acknowledged, None if aborted.
+        """
+        return await self._async_submit(command, **kwargs)
+
+    async def _async_submit(self, command, **kwargs):
         num_repeats = kwargs.get(ATTR_NUM_REPEATS, 1)
 
         delay = kwargs.get(ATTR_DELAY_SECS, DEFAULT_DELAY_SECS)
         hold = kwargs.get(ATTR_HOLD_SECS, DEFAULT_HOLD_SECS)
+        priority = kwargs.get(CONF_PRIORITY)
+        if priority is None:
+            priority = PRIORITY_INTERACTIVE if len(command) == 1 and num_repeats == 1\
+                else PRIORITY_BACKGROUND
+
+        rv = await self._scheduler.submit(
+            self._name,
+            partial(self._async_send_sequence, command, num_repeats, delay, hold),
+            priority=priority,
+            supersede=kwargs.get(CONF_SUPERSEDE, False))
+        if rv is None:
+            _LOGGER.info("%s: %s aborted", self._name, command)
+        return rv
 
-        for k in range(num_repeats):
-            j = 0
-            for c in command:
-                payloads = self.command2payloads(c)
-                i = 0
-                for local_payload in payloads:
-                    pause = await self._send_command(local_payload, 3)
-                    i += 1
-                    if i < len(payloads) and not pause:
-                        await asyncio.sleep(hold)
-                j += 1
-                if j < len(command) and k < num_repeats - 1:
-                    await asyncio.sleep(delay)
+    async def _async_send_sequence(self, command, num_repeats, delay, hold):
+        pacer = self._scheduler.pacer()
+        # The ack of a packet is waited for while the next one is paced
+        emitter = SerialEmitter(self._device.emit_ir, self._name, self._health.report)
+        ok = True
+        try:
+            await self._device.subscribe_if_necessary()
+            for k in range(num_repeats):
+                j = 0
+                for c in command:
+                    payloads = self.command2payloads(c)
+                    i = 0
+                    for local_payload in payloads:
+                        await pacer.wait()
+                        pause = await self._send_command(local_payload, emitter, pacer)
+                        ok = ok and pause is not None
+                        i += 1
+                        if pause:
+                            pacer.delay(pause)
+                        elif i < len(payloads):
+                            pacer.delay(hold)
+                    j += 1
+                    if j < len(command) and k < num_repeats - 1:
+                        pacer.delay(delay)
+            await pacer.wait()
+            await emitter.drain()
+        except asyncio.CancelledError:
+            emitter.cancel()
+            raise
+        _LOGGER.info("%s: %d/%d packets acknowledged (%d sent again)", self._name,
+                     emitter.acked, emitter.sent, emitter.retransmitted)
+        return ok and emitter.lost == 0
@@ -0,0 +1,248 @@
+# Copied into broadlink_asyncio, gocomma and orvibo_asyncio: keep the
+# copies identical (see check_shared.py at the top of the repository).
+"""Per device send scheduler used by the IR remote platforms."""
+import asyncio
+import logging
+from collections import OrderedDict, deque
+
+_LOGGER = logging.getLogger(__name__)
+
+PRIORITY_INTERACTIVE = 'interactive'
+PRIORITY_BACKGROUND = 'background'
+PRIORITIES = (PRIORITY_INTERACTIVE, PRIORITY_BACKGROUND)
+
+
+class SendScheduler(object):
+    """Serialize the sequences sent through one IR blaster.
+
+    The parent entity and every child entity of a device share the same
+    scheduler. Each entity has its own FIFO queue and the queues are served
+    round robin, one whole sequence at a time, so that concurrent callers
+    never interleave their packets.
+
+    Sequences belong to a priority lane. Interactive sequences are always
+    served first and, while a background sequence is running, they are sent
+    as soon as it reaches a checkpoint (before each packet and during its
+    pauses) instead of waiting for its end.
+    """
+
+    def __init__(self, name):
+        self._name = name
+        self._lanes = OrderedDict((p, OrderedDict()) for p in PRIORITIES)
+        self._task = None
+        self._running = []
+        self._wakeup = None
+        self._depth = 0
+        self._max_depth = 0
+        self._done = 0
+        self._preempted = 0
+        self._aborted = 0
+        self._last_wait = 0.0
+        self._avg_wait = 0.0
+        self._max_wait = 0.0
+        self._paced = 0
+        self._late = 0
+        self._avg_jitter = 0.0
+        self._max_jitter = 0.0
+
+    @property
+    def queue_depth(self):
+        """Return the number of sequences waiting to be sent."""
+        return self._depth
+
+    @property
+    def busy(self):
+        """Return True if a sequence is being sent."""
+        return bool(self._running)
+
+    @property
+    def metrics(self):
+        """Return queue depth and wait time statistics."""
+        return dict(
+            queue_depth=self._depth,
+            max_queue_depth=self._max_depth,
+            sent=self._done,
+            preempted=self._preempted,
+            aborted=self._aborted,
+            last_wait=round(self._last_wait, 3),
+            avg_wait=round(self._avg_wait, 3),
+            max_wait=round(self._max_wait, 3),
+            late=self._late,
+            avg_jitter=round(self._avg_jitter, 3),
+            max_jitter=round(self._max_jitter, 3))
+
+    def pacer(self):
+        """Return a Pacer for a new sequence."""
+        return Pacer(self)
+
+    def record_jitter(self, jitter, late=False):
+        """Account the distance of an emission from its deadline."""
+        self._paced += 1
+        if late:
+            self._late += 1
+        self._avg_jitter += (jitter - self._avg_jitter) / min(self._paced, 20)
+        if jitter > self._max_jitter:
+            self._max_jitter = jitter
+
+    async def submit(self, owner, job, priority=PRIORITY_BACKGROUND,
+                     supersede=False):
+        """Queue job (a coroutine function) for owner and wait for its result.
+
+        If supersede is True, the running and queued sequences are aborted
+        first. Aborted sequences return None to their caller.
+        """
+        loop = asyncio.get_event_loop()
+        if supersede:
+            self.abort()
+        fut = loop.create_future()
+        self._lanes[priority].setdefault(owner, deque()).append((job, fut, loop.time()))
+        self._depth += 1
+        if self._depth > self._max_depth:
+            self._max_depth = self._depth
+        if priority == PRIORITY_INTERACTIVE:
+            self._wake()
+        if self._task is None or self._task.done():
+            self._task = loop.create_task(self._worker())
+        return await fut
+
+    def abort(self):
+        """Abort the running sequence and drop all the queued ones."""
+        n = 0
+        for lane in self._lanes.values():
+            for queue in lane.values():
+                for _, fut, _ in queue:
+                    if not fut.done():
+                        fut.set_result(None)
+                        n += 1
+            lane.clear()
+        self._depth = 0
+        for _, task in self._running:
+            if not task.done():
+                task.cancel()
+                n += 1
+        if n:
+            self._aborted += n
+            _LOGGER.info("%s: aborted %d sequences", self._name, n)
+        return n
+
+    async def checkpoint(self):
+        """Let queued interactive sequences run before a background one goes on."""
+        if not self._running or self._running[-1][0] != PRIORITY_BACKGROUND:
+            return
+        while self._lanes[PRIORITY_INTERACTIVE]:
+            self._preempted += 1
+            await self._run(*self._next_job(PRIORITY_INTERACTIVE))
+
+    async def sleep(self, delay):
+        """Wait delay seconds serving interactive sequences meanwhile."""
+        await self.sleep_until(asyncio.get_event_loop().time() + delay)
+
+    async def sleep_until(self, deadline):
+        """Wait until the loop clock reaches deadline (see sleep)."""
+        loop = asyncio.get_event_loop()
+        while True:
+            await self.checkpoint()
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                return
+            if not self._running or self._running[-1][0] != PRIORITY_BACKGROUND:
+                await asyncio.sleep(remaining)
+                return
+            self._wakeup = loop.create_future()
+            try:
+                await asyncio.wait([self._wakeup], timeout=remaining)
+            finally:
+                self._wakeup = None
+
+    def _wake(self):
+        if self._wakeup is not None and not self._wakeup.done():
+            self._wakeup.set_result(True)
+
+    def _next_job(self, priority=None):
+        if priority is None:
+            priority = next(p for p, lane in self._lanes.items() if lane)
+        lane = self._lanes[priority]
+        owner, queue = next(iter(lane.items()))
+        item = queue.popleft()
+        if queue:
+            lane.move_to_end(owner)
+        else:
+            del lane[owner]
+        self._depth -= 1
+        return owner, priority, item
+
+    def _update_wait(self, wait):
+        self._done += 1
+        self._last_wait = wait
+        self._avg_wait += (wait - self._avg_wait) / min(self._done, 20)
+        if wait > self._max_wait:
+            self._max_wait = wait
+
+    async def _run(self, owner, priority, item):
+        job, fut, queued = item
+        if fut.done():
+            return
+        loop = asyncio.get_event_loop()
+        wait = loop.time() - queued
+        self._update_wait(wait)
+        _LOGGER.debug("%s: sending %s sequence for %s after %.3fs in queue (%d waiting)",
+                      self._name, priority, owner, wait, self._depth)
+        task = loop.create_task(job())
+        self._running.append((priority, task))
+        try:
+            await asyncio.wait([task])
+        finally:
+            self._running.remove((priority, task))
+        if fut.done():
+            return
+        if task.cancelled():
+            fut.set_result(None)
+        elif task.exception() is not None:
+            fut.set_exception(task.exception())
+        else:
+            fut.set_result(task.result())
+
+    async def _worker(self):
+        while self._depth:
+            await self._run(*self._next_job())
+        self._task = None
+
+
+class Pacer(object):
+    """Pace the emissions of a sequence against absolute deadlines.
+
+    Each gap (hold, delay or t token) is added to the deadline of the previous
+    emission, on the loop clock, instead of being slept after its network
+    round trip: send latency is absorbed by the gap and does not accumulate
+    along the sequence. When an emission misses its deadline because sending
+    took longer than the gap, the schedule restarts from that emission.
+    """
+
+    def __init__(self, scheduler):
+        self._scheduler = scheduler
+        self._deadline = None
+        self._paced = False
+
+    def delay(self, secs):
+        """Schedule the next emission secs after the last deadline."""
+        if secs > 0:
+            if self._deadline is None:
+                self._deadline = asyncio.get_event_loop().time()
+            self._deadline += secs
+            self._paced = True
+
+    async def wait(self):
+        """Wait for the deadline of the next emission."""
+        loop = asyncio.get_event_loop()
+        await self._scheduler.checkpoint()
+        now = loop.time()
+        if not self._paced:
+            self._deadline = now
+            return
+        self._paced = False
+        if now < self._deadline:
+            await self._scheduler.sleep_until(self._deadline)
+            self._scheduler.record_jitter(loop.time() - self._deadline)
+        else:
+            self._scheduler.record_jitter(now - self._deadline, True)
+            self._deadline = now
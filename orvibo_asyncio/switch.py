@@ -4,28 +4,36 @@ Support for Orvibo S20 Wifi Smart Switches.
 For more details about this platform, please refer to the documentation at
 https://home-assistant.io/components/switch.orvibo/
 """
+import asyncio
 import logging
 
 import voluptuous as vol
 
 from homeassistant.components.switch import (SwitchDevice, PLATFORM_SCHEMA, DOMAIN)
 from homeassistant.const import (
-    CONF_HOST, CONF_NAME, CONF_MAC, CONF_TIMEOUT)
+    CONF_HOST, CONF_NAME, CONF_MAC, CONF_TIMEOUT, ATTR_ENTITY_ID, CONF_STATE)
+from homeassistant.core import callback
 import homeassistant.helpers.config_validation as cv
+from homeassistant.helpers.event import async_call_later
 from datetime import timedelta
-from homeassistant.util import (Throttle)
 from .const import (CONF_BROADCAST_ADDRESS, ORVIBO_ASYNCIO_DATA_KEY)
-from . import get_orvibo_class
+from . import get_orvibo_class, get_orvibo_discovery, get_orvibo_mux
 
-MIN_TIME_BETWEEN_UPDATES = timedelta(minutes=2)
-REQUIREMENTS = ['asyncio-orvibo>=1.2']
+SUBSCRIPTION_RENEWAL = timedelta(minutes=2)
+REQUIREMENTS = ['asyncio-orvibo>=1.18']
 
 _LOGGER = logging.getLogger(__name__)
 
 DEFAULT_NAME = 'Orvibo S20 Switch'
 DEFAULT_DISCOVERY = True
 DEFAULT_TIMEOUT = 3
+DEFAULT_MAX_PARALLEL = 10
 DATA_KEY = "switch.orvibo_asyncio"
+CONF_MAX_PARALLEL = 'max_parallel'
+EVENT_SET_RESULT = 'orvibo_asyncio_switch_set_result'
+# Packets carrying the state of the S20 in their last byte: subscription
+# reply, state change reply and state change made with the button
+STATE_PACKET_IDS = (b'\x63\x6c', b'\x64\x63', b'\x73\x66')
 
 SERVICE_DISCOVERY = 'orvibo_asyncio_switch_discovery'
 DISCOVERY_COMMAND_SCHEMA = vol.Schema({
@@ -33,6 +41,13 @@ DISCOVERY_COMMAND_SCHEMA = vol.Schema({
     vol.Optional(CONF_BROADCAST_ADDRESS, default='255.255.255.255'): cv.string,
 })
 
+SERVICE_SET = 'orvibo_asyncio_switch_set'
+SET_COMMAND_SCHEMA = vol.Schema({
+    vol.Required(ATTR_ENTITY_ID): cv.entity_ids,
+    vol.Required(CONF_STATE): cv.boolean,
+    vol.Optional(CONF_MAX_PARALLEL, default=DEFAULT_MAX_PARALLEL): vol.All(int, vol.Range(min=1)),
+})
+
 PLATFORM_SCHEMA = PLATFORM_SCHEMA.extend({
     vol.Required(CONF_HOST): cv.string,
     vol.Optional(CONF_MAC): cv.string,
@@ -41,18 +56,44 @@ PLATFORM_SCHEMA = PLATFORM_SCHEMA.extend({
 })
 
 
+async def async_set_states(entities, state, parallel):
+    """Switch entities to state concurrently, at most parallel at a time.
+
+    The states pushed meanwhile are not written: the states of all the
+    entities are written in one pass when all of them are done, without
+    scheduling an update per entity. Return a dict entity_id -> dict(ok, latency).
+    """
+    semaphore = asyncio.Semaphore(parallel)
+    loop = asyncio.get_event_loop()
+
+    async def set_state(entity):
+        async with semaphore:
+            start = loop.time()
+            ok = await entity.async_set_state(state)
+            return entity.entity_id, dict(ok=ok, latency=round(loop.time() - start, 3))
+
+    for entity in entities:
+        entity.hold_writes()
+    try:
+        return dict(await asyncio.gather(*[set_state(e) for e in entities]))
+    finally:
+        for entity in entities:
+            entity.release_writes()
+
+
 async def async_setup_platform(hass, config, async_add_entities,
                                discovery_info=None):
     """Set up S20 switches."""
     S20 = get_orvibo_class(hass.data, 'S20')
     PORT = hass.data[ORVIBO_ASYNCIO_DATA_KEY]["PORT"]
+    mux = get_orvibo_mux(hass.data)
 
     if DATA_KEY not in hass.data:
         hass.data[DATA_KEY] = {}
     hassdata = hass.data[DATA_KEY]
     host = config.get(CONF_HOST)
     s20_obj = S20((host, PORT), mac=config.get(CONF_MAC), timeout=config.get(CONF_TIMEOUT))
-    s20_entity = S20Switch(config.get(CONF_NAME), s20_obj)
+    s20_entity = S20Switch(config.get(CONF_NAME), s20_obj, mux)
     async_add_entities([s20_entity])
     hassdata[host] = s20_entity
 
@@ -66,7 +107,9 @@ async def async_setup_platform(hass, config, async_add_entities,
         timeout = service.data.get(CONF_TIMEOUT, 5)
         broadcast = service.data.get(CONF_BROADCAST_ADDRESS, '255.255.255.255')
         new_switches = []
-        disc = await S20.discovery(broadcast_address=broadcast, timeout=timeout)
+        discovery = get_orvibo_discovery(hass.data)
+        await discovery.async_discover(broadcast, timeout)
+        disc = discovery.devices('S20')
         for _, v in disc.items():
             if v.hp[0] not in switch_data:
                 mac = S20.print_mac(v.mac)
@@ -78,7 +121,8 @@ async def async_setup_platform(hass, config, async_add_entities,
                     CONF_HOST: v.hp[0],
                     "obj": v}
                 _LOGGER.info("Discovered new S20 device %s", v)
-                new_switches.append(S20Switch(name, v))
+                new_switches.append(S20Switch(name, v, mux))
+                switch_data[v.hp[0]]["entity"] = new_switches[-1]
             else:
                 _LOGGER.info("Re-Discovered S20 device %s", v)
         if new_switches:
@@ -87,20 +131,77 @@ async def async_setup_platform(hass, config, async_add_entities,
     hass.services.async_register(DOMAIN, SERVICE_DISCOVERY, async_service_handler,
                                  schema=DISCOVERY_COMMAND_SCHEMA)
 
+    async def async_set_service_handler(service):
+        """Handle a bulk set command."""
+        entity_ids = service.data.get(ATTR_ENTITY_ID)
+        state = 1 if service.data.get(CONF_STATE) else 0
+        entities = []
+        for v in hass.data[DATA_KEY].values():
+            entity = v if isinstance(v, S20Switch) else v.get("entity")
+            if entity is not None and entity.entity_id in entity_ids:
+                entities.append(entity)
+        if len(entities) < len(entity_ids):
+            _LOGGER.error("entity_id: %s not found", ", ".join(
+                set(entity_ids) - set([e.entity_id for e in entities])))
+        results = await async_set_states(entities, state, service.data.get(CONF_MAX_PARALLEL))
+        _LOGGER.info("Switched %d/%d S20 %s", sum(1 for r in results.values() if r['ok']),
+                     len(results), "on" if state else "off")
+        hass.bus.async_fire(EVENT_SET_RESULT, dict(state=state, results=results))
+
+    hass.services.async_register(DOMAIN, SERVICE_SET, async_set_service_handler,
+                                 schema=SET_COMMAND_SCHEMA)
+
 
 class S20Switch(SwitchDevice):
-    """Representation of an S20 switch."""
+    """Representation of an S20 switch.
+
+    The state is not polled: the S20 sends its state to the subscribed
+    clients when it changes, also when the button is pressed, and the
+    subscription is renewed every SUBSCRIPTION_RENEWAL.
+    """
 
-    def __init__(self, name, s20):
+    def __init__(self, name, s20, mux):
         """Initialize the S20 device."""
 
         self._name = name
         self._s20 = s20
+        self._mux = mux
+        self._unsub_push = None
+        self._unsub_renew = None
+        self._writes_held = False
 
     @property
     def should_poll(self):
         """Return the polling state."""
-        return True
+        return False
+
+    async def async_added_to_hass(self):
+        self._unsub_push = self._mux.add_listener(self._s20.mac, self._async_datagram)
+        await self._async_renew()
+
+    async def async_will_remove_from_hass(self):
+        if self._unsub_push is not None:
+            self._unsub_push()
+            self._unsub_push = None
+        if self._unsub_renew is not None:
+            self._unsub_renew()
+            self._unsub_renew = None
+
+    @callback
+    def _async_datagram(self, data, addr):
+        if len(data) > 6 and data[4:6] in STATE_PACKET_IDS:
+            state = 0 if data[-1:] == b'\x00' else 1
+            if state != self._s20.state:
+                _LOGGER.debug("%s is now %s", self._name, "on" if state else "off")
+                self._s20.state = state
+                if not self._writes_held:
+                    self.async_schedule_update_ha_state()
+
+    async def _async_renew(self, now=None):
+        self._unsub_renew = None
+        await self.async_update()
+        self._unsub_renew = async_call_later(
+            self.hass, SUBSCRIPTION_RENEWAL.total_seconds(), self._async_renew)
 
     @property
     def name(self):
@@ -112,26 +213,37 @@ class S20Switch(SwitchDevice):
         """Return true if device is on."""
         return self._s20.state == 1
 
-    @Throttle(MIN_TIME_BETWEEN_UPDATES)
     async def async_update(self):
-        """Update device state."""
+        """Renew the subscription (the state is pushed by the device)."""
         try:
             await self._s20.subscribe_if_necessary()
         except Exception as ex:
             _LOGGER.exception("Error while fetching S20 state, %s", ex)
 
-    async def async_turn_on(self, **kwargs):
-        """Turn the device on."""
+    def hold_writes(self):
+        """Stop writing the state to Home Assistant until release_writes."""
+        self._writes_held = True
+
+    @callback
+    def release_writes(self):
+        """Write the state to Home Assistant now and again at each change."""
+        self._writes_held = False
+        self.async_write_ha_state()
+
+    async def async_set_state(self, state):
+        """Turn the device on (state=1) or off (state=0); return True on success."""
         try:
-            if await self._s20.state_change(1):
-                await self.async_update_ha_state()
+            return await self._s20.state_change(state)
         except Exception as ex:
-            _LOGGER.exception("Error while turning on S20, %s", ex)
+            _LOGGER.exception("Error while turning %s S20, %s", "on" if state else "off", ex)
+            return False
+
+    async def async_turn_on(self, **kwargs):
+        """Turn the device on."""
+        if await self.async_set_state(1):
+            await self.async_update_ha_state()
 
     async def async_turn_off(self, **kwargs):
         """Turn the device off."""
-        try:
-            if await self._s20.state_change(0):
-                await self.async_update_ha_state()
-        except Exception as ex:
-            _LOGGER.exception("Error while turning off S20, %s", ex)
+        if await self.async_set_state(0):
+            await self.async_update_ha_state()
@@ -200,11 +200,19 @@ class RestRemote(RemoteDevice):
         delay = kwargs.get(ATTR_DELAY_SECS, DEFAULT_DELAY_SECS)
         hold = kwargs.get(ATTR_HOLD_SECS, DEFAULT_HOLD_SECS)
         timestr = self.get_ttimeout_struct(command_list, num_repeats, delay, aiohttp.ClientTimeout)
+        loop = asyncio.get_event_loop()
+        deadline = loop.time()
         async with aiohttp.ClientSession(timeout=timestr) as session:
             for k in range(num_repeats):
                 j = 0
                 for c in command_list:
                     if c in self._commands:
+                        now = loop.time()
+                        if now < deadline:
+                            await asyncio.sleep(deadline - now)
+                        else:
+                            # A missed deadline restarts the schedule from now
+                            deadline = now
                         desc = self._commands[c]
                         try:
                             rv = await desc.do(session)
@@ -220,6 +228,6 @@ class RestRemote(RemoteDevice):
                                 self._state = STATE_OFF
                         j += 1
                         if j < len(command_list) or k < num_repeats - 1:
-                            await asyncio.sleep(hold)
+                            deadline += hold
                 if k < num_repeats - 1:
-                    await asyncio.sleep(delay)
+                    deadline += delay
@@ -0,0 +1,5 @@
+"""Make the custom components importable as top level packages."""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
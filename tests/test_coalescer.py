@@ -0,0 +1,87 @@
+"""Tests of the coalescing of the relative keys."""
+import asyncio
+
+import pytest
+
+pytest.importorskip('homeassistant')
+
+from broadlink_asyncio.coalescer import Coalescer, split_repeat  # noqa: E402
+
+UP = 'tv@volume_up'
+DOWN = 'tv@volume_down'
+
+
+def coalescer():
+    return Coalescer([dict(keys=[UP, DOWN], window=0.01)])
+
+
+def test_split_repeat():
+    assert split_repeat(UP + '#3') == (UP, 3)
+    assert split_repeat(UP) == (UP, 1)
+
+
+def test_presses_are_merged():
+    async def main():
+        coal = coalescer()
+        sent = []
+
+        async def emit(key, num):
+            sent.append((key, num))
+            return 'done'
+        rv = await asyncio.gather(coal.submit(UP, 2, emit), coal.submit(UP, 1, emit),
+                                  coal.submit(DOWN, 1, emit))
+        assert rv == ['done'] * 3
+        assert sent == [(UP, 2)]
+        assert coal.metrics == dict(presses=4, emissions=1)
+    asyncio.run(main())
+
+
+def test_opposite_key_wins():
+    async def main():
+        coal = coalescer()
+        sent = []
+
+        async def emit(key, num):
+            sent.append((key, num))
+            return True
+        await asyncio.gather(coal.submit(UP, 1, emit), coal.submit(DOWN, 3, emit))
+        assert sent == [(DOWN, 2)]
+    asyncio.run(main())
+
+
+def test_presses_cancelling_out_send_nothing():
+    async def main():
+        coal = coalescer()
+
+        async def emit(key, num):
+            raise AssertionError('nothing to send')
+        rv = await asyncio.gather(coal.submit(UP, 2, emit), coal.submit(DOWN, 2, emit))
+        assert rv == [True, True]
+        assert coal.metrics == dict(presses=4, emissions=0)
+    asyncio.run(main())
+
+
+def test_errors_reach_every_caller():
+    async def main():
+        coal = coalescer()
+
+        async def emit(key, num):
+            raise OSError('unreachable')
+        rv = await asyncio.gather(coal.submit(UP, 1, emit), coal.submit(UP, 1, emit),
+                                  return_exceptions=True)
+        assert all(isinstance(ex, OSError) for ex in rv)
+    asyncio.run(main())
+
+
+def test_windows_are_separate():
+    async def main():
+        coal = coalescer()
+        sent = []
+
+        async def emit(key, num):
+            sent.append((key, num))
+            return True
+        await coal.submit(UP, 1, emit)
+        await coal.submit(UP, 1, emit)
+        assert sent == [(UP, 1), (UP, 1)]
+    asyncio.run(main())
@@ -0,0 +1,74 @@
+"""Tests of the Broadlink IR frame codec."""
+import struct
+
+import pytest
+
+from broadlink_asyncio.codec import (
+    IR_TYPE, TICK, decode_packet, encode_packet, join_packets, set_repeat)
+
+CODE = [9000, 4500, 560, 1690, 560, 560]
+
+
+def test_encode_decode_round_trip():
+    packet = encode_packet(CODE, repeat=2)
+    assert packet[0] == IR_TYPE
+    assert packet[1] == 2
+    assert struct.unpack_from('<H', packet, 2)[0] == len(packet) - 4
+    assert all(abs(a - b) <= TICK / 2 for a, b in zip(decode_packet(packet), CODE))
+
+
+def test_long_timings_take_three_bytes():
+    packet = encode_packet([20000, 100])
+    assert packet[4] == 0
+    assert packet[4:7] == bytes([0, round(20000 / TICK) >> 8, round(20000 / TICK) & 0xff])
+    assert len(decode_packet(packet)) == 2
+
+
+@pytest.mark.parametrize('packet', [b'\x26\x00', b'\x26\x00\x05\x00\x10', b'\x26\x00\x02\x00\x10\x00'])
+def test_decode_rejects_broken_frames(packet):
+    with pytest.raises(ValueError):
+        decode_packet(packet)
+
+
+def test_set_repeat_clamps():
+    packet = encode_packet(CODE)
+    assert set_repeat(packet, 3)[1] == 3
+    assert set_repeat(packet, 300)[1] == 255
+    assert set_repeat(packet, -1)[1] == 0
+    assert set_repeat(packet, 3)[2:] == packet[2:]
+
+
+def test_join_puts_the_gap_in_the_trailing_space():
+    first = encode_packet(CODE[:5])
+    second = encode_packet(CODE)
+    joined, last_start = join_packets([first, second], [100000])
+    assert last_start == 100000
+    durations = decode_packet(joined)
+    assert len(durations) == 6 + len(CODE)
+    assert abs(sum(durations[:6]) - 100000) <= TICK
+    assert durations[6:] == decode_packet(second)
+
+
+def test_join_keeps_a_longer_trailing_space():
+    first = encode_packet(CODE)
+    joined, last_start = join_packets([first, first], [1000])
+    assert last_start == sum(decode_packet(first))
+    assert decode_packet(joined) == decode_packet(first) * 2
+
+
+def test_join_expands_the_repeat_count():
+    packet = encode_packet(CODE, repeat=2)
+    joined, last_start = join_packets([packet], [])
+    assert joined[1] == 0
+    assert last_start == 0
+    assert decode_packet(joined) == decode_packet(packet) * 3
+
+
+def test_join_rejects_non_ir_frames():
+    with pytest.raises(ValueError):
+        join_packets([encode_packet(CODE, ir_type=0xb2)], [])
+
+
+def test_join_rejects_gaps_too_long():
+    with pytest.raises(ValueError):
+        join_packets([encode_packet(CODE), encode_packet(CODE)], [10000000])
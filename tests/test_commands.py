@@ -0,0 +1,49 @@
+"""Tests of the command string compiler and of its plan cache."""
+from broadlink_asyncio.commands import CommandCompiler
+
+COMMANDS = dict(power=('P',), ch1=('1',), ch2=('2',), mute=('M1', 'M2'))
+
+
+def compiler(maxsize=2):
+    decoded = []
+
+    def decode(command):
+        decoded.append(command)
+        return (command.upper(),)
+    return CommandCompiler(COMMANDS, decode, maxsize), decoded
+
+
+def test_compile():
+    comp, decoded = compiler()
+    assert comp.compile('power') == ('P',)
+    assert comp.compile('ch21') == ('2', '1')
+    assert comp.compile('mute#3') == (('M1', 3), ('M2', 3))
+    assert comp.compile('missing#3') == ()
+    assert comp.compile('@power') == ('POWER',)
+    assert comp.compile('raw') == ('RAW',)
+    assert decoded == ['power', 'raw']
+
+
+def test_plans_are_cached():
+    comp, decoded = compiler()
+    assert comp.get('@a') is comp.get('@a')
+    assert decoded == ['a']
+
+
+def test_least_recently_used_plan_is_evicted():
+    comp, decoded = compiler(maxsize=2)
+    comp.get('@a')
+    comp.get('@b')
+    comp.get('@a')
+    comp.get('@c')
+    comp.get('@a')
+    assert decoded == ['a', 'b', 'c']
+    comp.get('@b')
+    assert decoded == ['a', 'b', 'c', 'b']
+
+
+def test_new_commands_invalidate_the_plans():
+    comp, decoded = compiler()
+    assert comp.get('power') == ('P',)
+    comp.commands = dict(power=('Q',))
+    assert comp.get('power') == ('Q',)
@@ -0,0 +1,74 @@
+"""Tests of the deadlines of the Pacer."""
+import asyncio
+
+from broadlink_asyncio.scheduler import Pacer
+
+
+class FakeScheduler(object):
+    """Record the waits of a Pacer instead of sleeping."""
+
+    def __init__(self):
+        self.sleeps = []
+        self.jitters = []
+
+    async def checkpoint(self):
+        pass
+
+    async def sleep_until(self, deadline):
+        self.sleeps.append(deadline)
+
+    def record_jitter(self, jitter, late=False):
+        self.jitters.append(late)
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_unpaced_wait_does_not_sleep():
+    async def main():
+        sched = FakeScheduler()
+        pacer = Pacer(sched)
+        await pacer.wait()
+        pacer.delay(0)
+        await pacer.wait()
+        assert sched.sleeps == []
+        assert sched.jitters == []
+    run(main())
+
+
+def test_gaps_add_up_on_the_previous_deadline():
+    async def main():
+        sched = FakeScheduler()
+        pacer = Pacer(sched)
+        await pacer.wait()
+        start = pacer._deadline
+        pacer.delay(10)
+        await pacer.wait()
+        pacer.delay(5)
+        pacer.delay(1)
+        await pacer.wait()
+        # The fake scheduler does not sleep: the second deadline is still
+        # counted from the first one, not from the time of the emission
+        assert sched.sleeps == [start + 10, start + 16]
+        assert sched.jitters == [False, False]
+    run(main())
+
+
+def test_missed_deadline_restarts_from_now():
+    async def main():
+        loop = asyncio.get_event_loop()
+        sched = FakeScheduler()
+        pacer = Pacer(sched)
+        await pacer.wait()
+        pacer.delay(0.01)
+        await asyncio.sleep(0.05)
+        await pacer.wait()
+        assert sched.sleeps == []
+        assert sched.jitters == [True]
+        restart = pacer._deadline
+        assert restart <= loop.time()
+        pacer.delay(10)
+        await pacer.wait()
+        assert sched.sleeps == [restart + 10]
+    run(main())
@@ -0,0 +1,43 @@
+"""Tests of the joined repeats of the Gocomma R9 codes."""
+import struct
+
+from gocomma.codec import repeat_payload
+
+
+def shorts(*values):
+    return struct.pack('<%dH' % len(values), *values)
+
+
+def test_single_press_is_sent_as_it_is():
+    payload = shorts(9000, 4500, 560)
+    assert repeat_payload(payload, 1) == [(payload, 1)]
+    assert repeat_payload(payload, 0) == [(payload, 1)]
+
+
+def test_odd_byte_payloads_are_not_joined():
+    assert repeat_payload(b'abc', 3) == [(b'abc', 1)] * 3
+
+
+def test_gap_is_appended_after_a_final_pulse():
+    payload = shorts(9000, 4500, 560)
+    assert repeat_payload(payload, 3, gap=40000) == [
+        (payload + shorts(40000) + payload + shorts(40000) + payload, 3)]
+
+
+def test_final_space_is_stretched_to_the_gap():
+    payload = shorts(9000, 4500, 560, 560)
+    unit = shorts(9000, 4500, 560, 40000)
+    assert repeat_payload(payload, 2, gap=40000) == [(unit + payload, 2)]
+
+
+def test_longer_final_space_is_kept():
+    payload = shorts(9000, 4500, 560, 50000)
+    assert repeat_payload(payload, 2, gap=40000) == [(payload * 2, 2)]
+
+
+def test_joined_payloads_fit_maxsize():
+    payload = shorts(9000, 4500, 560)
+    rv = repeat_payload(payload, 7, gap=40000, maxsize=22)
+    assert [count for _, count in rv] == [3, 3, 1]
+    assert all(len(frame) <= 22 for frame, _ in rv)
+    assert rv[-1] == (payload, 1)
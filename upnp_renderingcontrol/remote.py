@@ -201,8 +201,7 @@ class RCRemote(RemoteDevice):
         num = packet[1]
         packet = packet[0]
         if isinstance(packet, float):
-            await asyncio.sleep(packet)
-            return True
+            return packet
         else:
             for r in range(totretry):
                 _LOGGER.info("Pid is %s, Rep is %d (%d/%d)", packet, num, r, totretry)
@@ -260,16 +259,29 @@ class RCRemote(RemoteDevice):
     async def async_send_command(self, command, **kwargs):
         """Send a command."""
         delay = kwargs.get(ATTR_DELAY_SECS, DEFAULT_DELAY_SECS)
+        loop = asyncio.get_event_loop()
+        deadline = loop.time()
         j = 0
         for c in command:
             payloads = self.command2payloads(c)
             k = 0
             pause = False
             for local_payload in payloads:
+                now = loop.time()
+                if now < deadline:
+                    await asyncio.sleep(deadline - now)
+                else:
+                    # A missed deadline restarts the schedule from now
+                    deadline = now
                 pause = await self._send_command(local_payload, 3)
                 k += 1
-                if not pause and k < len(payloads):
-                    await asyncio.sleep(delay)
+                # A t command replaces the delay, even when it is t0
+                if pause is not False:
+                    deadline += pause
+                elif k < len(payloads):
+                    deadline += delay
             j += 1
-            if not pause and j < len(command):
-                await asyncio.sleep(delay)
+            if pause is False and j < len(command):
+                deadline += delay
+        if deadline > loop.time():
+            await asyncio.sleep(deadline - loop.time())